@@ -1,45 +1,368 @@
-from typing import Union, List, Dict
-import RPi.GPIO as GPIO
+import mmap
+import os
+import select
+import threading
+from typing import Union, List, Dict, Optional
 from pymodaq.control_modules.move_utility_classes import (
     DAQ_Move_base, comon_parameters_fun, main, DataActuatorType, DataActuator
 )
 from pymodaq.utils.daq_utils import ThreadCommand
 from pymodaq.utils.parameter import Parameter
 
-# Optionally disable warnings if reinitialization is expected:
-# GPIO.setwarnings(False)
+from pymodaq_plugins_raspberrypi.hardware.gpio_cdev import (
+    GPIOLines, GPIO_V2_LINE_FLAG_INPUT, GPIO_V2_LINE_FLAG_OUTPUT, GPIO_V2_LINE_FLAG_EDGE_RISING,
+    GPIO_V2_LINE_FLAG_EDGE_FALLING, GPIO_V2_LINE_EVENT_RISING_EDGE, pack_values
+)
+
+# GPIO backend, imported on first use (see _load_backend) so plugin discovery doesn't pull it in
+_BACKEND = None
+lgpio = None
+GPIO = None
+
+
+def _load_backend():
+    """Select the GPIO backend once per process.
+
+    Prefer the lgpio character-device backend (/dev/gpiochipN), fall back to RPi.GPIO when unavailable,
+    and to plain ioctls on the GPIO character device when neither is installed.
+    """
+    global _BACKEND, lgpio, GPIO
+    if _BACKEND is not None:
+        return
+    try:
+        import lgpio
+        _BACKEND = 'lgpio'
+    except ImportError:
+        try:
+            import RPi.GPIO as GPIO
+            _BACKEND = 'rpi'
+            # Optionally disable warnings if reinitialization is expected:
+            # GPIO.setwarnings(False)
+        except ImportError:
+            _BACKEND = 'cdev'
+
+GPIO_CHIP = 0  # /dev/gpiochip0 hosts the header GPIOs (use 4 on a Raspberry Pi 5)
+
+# Process-wide RPi.GPIO bookkeeping so the numbering mode is set once and only pins we own get cleaned up
+_GPIO_MODE_SET = False
+_OWNED_PINS: set = set()
+
+class GPIOMemRegisters:
+    """Direct access to the BCM283x/BCM2711 GPIO bank 0 registers through ``/dev/gpiomem``.
+
+    Only the set/clear/level registers are used: pins must already be configured as outputs
+    by the regular backend. Not available on the Raspberry Pi 5 (RP1 has a different layout).
+    """
+
+    GPSET0 = 7  # 32-bit word offsets in the GPIO register block
+    GPCLR0 = 10
+    GPLEV0 = 13
+
+    def __init__(self, path: str = '/dev/gpiomem'):
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self._mm = mmap.mmap(fd, 4096, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)  # The mapping stays valid once the descriptor is closed
+        self.regs = memoryview(self._mm).cast('I')
+
+    def close(self):
+        """Unmap the register block."""
+        self.regs.release()
+        self._mm.close()
+
+
+DEVICE_TREE_COMPATIBLE = '/proc/device-tree/compatible'
+# SoCs whose /dev/gpiomem maps the register layout of GPIOMemRegisters
+GPIOMEM_SOCS = frozenset((b'brcm,bcm2835', b'brcm,bcm2836', b'brcm,bcm2837', b'brcm,bcm2711'))
+
+
+def gpiomem_supported() -> bool:
+    """Check from the device tree that the GPIO block behind ``/dev/gpiomem`` has the BCM283x layout."""
+    try:
+        with open(DEVICE_TREE_COMPATIBLE, 'rb') as f:
+            compatible = f.read().split(b'\0')  # NUL separated list of compatible strings
+    except OSError:
+        return False
+    return not GPIOMEM_SOCS.isdisjoint(compatible)
+
+
+def open_gpiomem() -> Optional[GPIOMemRegisters]:
+    """Map the GPIO registers if ``/dev/gpiomem`` is usable on this SoC, else return None."""
+    if not gpiomem_supported():
+        return None  # e.g. Raspberry Pi 5 (bcm2712 + RP1), the backend writes the pins instead
+    try:
+        return GPIOMemRegisters()
+    except (OSError, ValueError):
+        return None
+
 
 class GPIORelayWrapper:
-    """Handles GPIO operations for controlling a relay on fixed pin 26."""
+    """Handles GPIO operations for controlling a relay (GPIO pin 26 by default)."""
     
-    RELAY_PIN = 26  # Fixed GPIO pin for relay control
+    RELAY_PIN = 26  # Default GPIO pin for relay control
 
-    def __init__(self):
+    def __init__(self, pin: int = RELAY_PIN):
         """Initialize GPIO mode and setup relay pin."""
+        _load_backend()
+        # Pins claimed by this wrapper: lgpio and cdev claims belong to the wrapper's own chip handle or
+        # line requests, RPi.GPIO's pin setup is process-wide
+        self._owned: set = _OWNED_PINS if _BACKEND == 'rpi' else set()
+        self.pin = pin
+        self._h = None  # lgpio chip handle, opened once and kept for the wrapper lifetime
+        self._line: GPIOLines = None  # Line request of the 'cdev' backend driving the relay pin
+        self._line_mask = 1  # Bit of the relay pin in self._line (the group request may hold several lines)
+        self._group: tuple = ()  # pins currently claimed as an output group by set_states
+        self._group_line: GPIOLines = None  # Line request of the group on the 'cdev' backend
+        self._watch_pin = None  # input pin mirroring the relay line, watched for edges
+        self._watch_cb = None
+        self._watch_line: GPIOLines = None  # Edge events of the sense pin on the 'cdev' backend
+        self._watch_thread: threading.Thread = None
+        self._watch_stop = threading.Event()
         self._setup_gpio()
+        # Toggle through the mmapped registers when possible, the backend is then only used for setup
+        self._mem = open_gpiomem()
+        self._setup_registers()
+        self._last_state = 0  # The plugin is the only writer, so the last written state is the relay state
+
+    def _setup_registers(self):
+        """Precompute the register mask and the register written for each state (active low relay)."""
+        if self._mem is None:
+            return
+        self._mask = 1 << self.pin
+        self._reg_for_state = (GPIOMemRegisters.GPSET0, GPIOMemRegisters.GPCLR0)  # OFF sets, ON clears
 
     def _setup_gpio(self):
         """Setup the GPIO pin for relay control."""
-        if GPIO.getmode() is None:
-            GPIO.setmode(GPIO.BCM)
-        # Check if the pin is already set as an output to avoid reinitializing it:
-        if GPIO.gpio_function(self.RELAY_PIN) != GPIO.OUT:
-            GPIO.setup(self.RELAY_PIN, GPIO.OUT)
+        if _BACKEND == 'lgpio':
+            self._levels = (1, 0)  # Output level indexed by state: OFF is HIGH, ON is LOW (active low relay)
+            if self._h is None:
+                self._h = lgpio.gpiochip_open(GPIO_CHIP)
+            if self.pin not in self._owned:
+                # Claim as output with the default state OFF (HIGH for an active low relay)
+                lgpio.gpio_claim_output(self._h, self.pin, 1)
+                self._owned.add(self.pin)
+            else:
+                lgpio.gpio_write(self._h, self.pin, 1)
+            return
+
+        if _BACKEND == 'cdev':
+            self._levels = (pack_values(1), pack_values(0))  # Prebuilt ioctl buffers indexed by state
+            self._line_mask = 1
+            if self._line is None:
+                self._line = GPIOLines([self.pin], GPIO_V2_LINE_FLAG_OUTPUT, chip=GPIO_CHIP,
+                                       consumer='pymodaq relay', output_values=1)
+                self._owned.add(self.pin)
+            else:
+                self._line.write_values(self._levels[0])
+            return
+
+        self._levels = (GPIO.HIGH, GPIO.LOW)  # Output level indexed by state (active low relay)
+        global _GPIO_MODE_SET
+        if not _GPIO_MODE_SET:
+            if GPIO.getmode() is None:
+                GPIO.setmode(GPIO.BCM)
+            _GPIO_MODE_SET = True
+        # Only configure the pin once, as long as we still own it:
+        if self.pin not in self._owned:
+            GPIO.setup(self.pin, GPIO.OUT)
+            self._owned.add(self.pin)
         # Set the default state to OFF (HIGH for an active low relay)
-        GPIO.output(self.RELAY_PIN, GPIO.HIGH)
+        GPIO.output(self.pin, GPIO.HIGH)
 
     def get_state(self) -> int:
-        """Get the current relay state (0 = OFF, 1 = ON)."""
-        # For an active low relay, GPIO.LOW means ON
-        return int(not GPIO.input(self.RELAY_PIN))
+        """Get the last written relay state (0 = OFF, 1 = ON) without touching the hardware."""
+        return self._last_state
+
+    def refresh_from_hw(self) -> int:
+        """Read the relay state back from the GPIO pin (0 = OFF, 1 = ON) and update the cached state."""
+        # For an active low relay, a LOW level means ON
+        pin = self.pin if self._watch_pin is None else self._watch_pin
+        if self._mem is not None:
+            level = (self._mem.regs[GPIOMemRegisters.GPLEV0] >> pin) & 1
+        elif _BACKEND == 'lgpio':
+            level = lgpio.gpio_read(self._h, pin)
+        elif _BACKEND == 'cdev':
+            if self._watch_line is not None:
+                level = self._watch_line.get_values() & 1
+            else:
+                level = int(self._line.get_values(self._line_mask) != 0)
+        else:
+            level = GPIO.input(pin)
+        self._last_state = int(not level)
+        return self._last_state
 
     def set_state(self, state: int):
-        """Set relay state (1 = ON, 0 = OFF)."""
-        GPIO.output(self.RELAY_PIN, GPIO.LOW if state == 1 else GPIO.HIGH)
+        """Set relay state (1 = ON, anything else = OFF)."""
+        state = 1 if state == 1 else 0
+        if self._mem is not None:
+            self._mem.regs[self._reg_for_state[state]] = self._mask
+        elif _BACKEND == 'lgpio':
+            lgpio.gpio_write(self._h, self.pin, self._levels[state])
+        elif _BACKEND == 'cdev':
+            self._line.write_values(self._levels[state])
+        else:
+            GPIO.output(self.pin, self._levels[state])
+        self._last_state = state
+
+    def set_states(self, pin_state_pairs: Dict[int, int]):
+        """Set several relays at once (1 = ON, 0 = OFF) with a single GPIO write.
+
+        Parameters
+        ----------
+        pin_state_pairs: dict
+            Mapping of BCM pin number to the relay state to apply on that pin.
+        """
+        pins = list(pin_state_pairs)
+        states = [1 if pin_state_pairs[pin] == 1 else 0 for pin in pins]
+        if _BACKEND in ('lgpio', 'cdev'):
+            if tuple(pins) != self._group:
+                self._claim_group(pins)
+            # One bit per relay in group order, HIGH (1) means OFF for an active low relay
+            bits = 0
+            for ind, state in enumerate(states):
+                bits |= (state ^ 1) << ind
+            if _BACKEND == 'lgpio':
+                lgpio.group_write(self._h, pins[0], bits)
+            else:
+                self._group_line.set_values(bits, (1 << len(pins)) - 1)
+        else:
+            for pin in pins:
+                if pin not in self._owned:
+                    GPIO.setup(pin, GPIO.OUT)
+                    self._owned.add(pin)
+            GPIO.output(pins, [self._levels[state] for state in states])
+        if self.pin in pin_state_pairs:
+            self._last_state = 1 if pin_state_pairs[self.pin] == 1 else 0
+
+    def _claim_group(self, pins: List[int]):
+        """Claim the given pins as one output group so they can be written with one call."""
+        self._free_group()
+        if self.pin not in pins and self.pin not in self._owned:
+            self._setup_gpio()  # The previous group took the relay pin along, claim it back on its own
+        if _BACKEND == 'cdev':
+            if self.pin in pins:
+                self._line.close()  # The group request takes over the relay line
+            self._group_line = GPIOLines(pins, GPIO_V2_LINE_FLAG_OUTPUT, chip=GPIO_CHIP,
+                                         consumer='pymodaq relay', output_values=(1 << len(pins)) - 1)
+            if self.pin in pins:
+                # set_state then writes the relay bit of the group request
+                self._line = self._group_line
+                self._line_mask = 1 << pins.index(self.pin)
+                self._levels = (pack_values(self._line_mask, self._line_mask), pack_values(0, self._line_mask))
+        else:
+            for pin in pins:
+                if pin in self._owned:
+                    lgpio.gpio_free(self._h, pin)
+            lgpio.group_claim_output(self._h, pins, [1] * len(pins))
+        self._owned.update(pins)
+        self._group = tuple(pins)
+
+    def _free_group(self):
+        """Release the group claimed by set_states, if any."""
+        if self._group:
+            if _BACKEND == 'cdev':
+                self._group_line.close()
+                if self._line is self._group_line:
+                    self._line = None
+                self._group_line = None
+            else:
+                lgpio.group_free(self._h, self._group[0])
+            self._owned.difference_update(self._group)
+            self._group = ()
+
+    def start_watch(self, sense_pin: int):
+        """Track external relay changes from edges on an input pin mirroring the relay line.
+
+        The edge callbacks run on the backend's background thread (a thread of ours reading the line
+        events on the 'cdev' backend); they only publish a plain integer to ``_last_state`` (atomic in
+        CPython) so ``get_state`` stays a syscall-free read.
+        """
+        self.stop_watch()
+        if _BACKEND == 'lgpio':
+            lgpio.gpio_claim_alert(self._h, sense_pin, lgpio.BOTH_EDGES)
+            self._watch_cb = lgpio.callback(self._h, sense_pin, lgpio.BOTH_EDGES, self._on_edge)
+        elif _BACKEND == 'cdev':
+            self._watch_line = GPIOLines([sense_pin], GPIO_V2_LINE_FLAG_INPUT | GPIO_V2_LINE_FLAG_EDGE_RISING
+                                         | GPIO_V2_LINE_FLAG_EDGE_FALLING, chip=GPIO_CHIP,
+                                         consumer='pymodaq relay feedback')
+            self._watch_stop.clear()
+            self._watch_thread = threading.Thread(target=self._watch_loop, args=(sense_pin,), daemon=True)
+            self._watch_thread.start()
+        else:
+            GPIO.setup(sense_pin, GPIO.IN)
+            GPIO.add_event_detect(sense_pin, GPIO.BOTH,
+                                  callback=lambda channel: self._on_edge(None, channel, GPIO.input(channel), None))
+        self._owned.add(sense_pin)
+        self._watch_pin = sense_pin
+        self.refresh_from_hw()
+
+    def stop_watch(self):
+        """Stop watching the sense pin, if any."""
+        if self._watch_pin is None:
+            return
+        if _BACKEND == 'lgpio':
+            if self._watch_cb is not None:
+                self._watch_cb.cancel()
+            lgpio.gpio_free(self._h, self._watch_pin)
+        elif _BACKEND == 'cdev':
+            self._watch_stop.set()
+            self._watch_thread.join()  # Returns within one poll timeout
+            self._watch_thread = None
+            self._watch_line.close()
+            self._watch_line = None
+        else:
+            GPIO.remove_event_detect(self._watch_pin)
+            GPIO.cleanup(self._watch_pin)
+        self._owned.discard(self._watch_pin)
+        self._watch_pin = None
+        self._watch_cb = None
+
+    def _watch_loop(self, sense_pin: int):
+        """Read the sense pin edge events ('cdev' backend) until stop_watch is called."""
+        poller = select.poll()
+        poller.register(self._watch_line.fd, select.POLLIN)
+        while not self._watch_stop.is_set():
+            if poller.poll(100):  # ms, bounds the stop_watch latency
+                _, event_id, _ = self._watch_line.read_event()
+                self._on_edge(None, sense_pin, int(event_id == GPIO_V2_LINE_EVENT_RISING_EDGE), None)
+
+    def _on_edge(self, chip, gpio, level, tick):
+        """Edge callback: publish the relay state seen on the sense pin (active low)."""
+        self._last_state = int(not level)
+
+    def change_pin(self, pin: int):
+        """Release the current pin and drive the relay from a new one."""
+        if pin == self.pin:
+            return
+        self.cleanup()
+        self.pin = pin
+        self._setup_gpio()
+        self._mem = open_gpiomem()
+        self._setup_registers()
+        self._last_state = 0
 
     def cleanup(self):
-        """Cleanup GPIO when done."""
-        GPIO.cleanup(self.RELAY_PIN)
+        """Cleanup GPIO when done (only the pins owned by this wrapper)."""
+        self.stop_watch()
+        if _BACKEND == 'lgpio':
+            if self._h is not None:
+                self._free_group()
+                if self.pin in self._owned:
+                    lgpio.gpio_free(self._h, self.pin)
+                lgpio.gpiochip_close(self._h)
+                self._h = None
+        elif _BACKEND == 'cdev':
+            self._free_group()
+            if self._line is not None:
+                self._line.close()
+                self._line = None
+        elif self.pin in self._owned:
+            GPIO.cleanup(self.pin)
+        self._owned.discard(self.pin)
+        if self._mem is not None:
+            self._mem.close()
+            self._mem = None
 
 
 class DAQ_Move_Relay(DAQ_Move_base):
@@ -50,23 +373,71 @@ class DAQ_Move_Relay(DAQ_Move_base):
     _controller_units: Union[str, List[str]] = ''
     _epsilon: Union[float, List[float]] = 0
     data_actuator_type = DataActuatorType.DataActuator  # Controls an ON/OFF device
+    _state_strs = ('OFF', 'ON')  # Relay state labels indexed by state
+
+    # Invariant status messages, built once (ThreadCommand payloads are only read by the receivers)
+    _MSG_HOME = ThreadCommand('Update_Status', ['Relay moved to HOME (OFF)'])
+    _MSG_CLEANUP = ThreadCommand('Update_Status', ['GPIO cleanup done'])
+    _MSG_TURN = ('Relay turned OFF', 'Relay turned ON')
 
     params = [
-        {'title': 'Relay State', 'name': 'relay_state', 'type': 'list', 'limits': ['OFF', 'ON'], 'value': 'OFF'}
+        {'title': 'Relay State', 'name': 'relay_state', 'type': 'list', 'limits': ['OFF', 'ON'], 'value': 'OFF'},
+        {'title': 'Relay Pin', 'name': 'relay_pin', 'type': 'int', 'value': GPIORelayWrapper.RELAY_PIN, 'min': 0,
+         'max': 27},
+        {'title': 'Feedback Pin (-1 = none)', 'name': 'feedback_pin', 'type': 'int', 'value': -1, 'min': -1,
+         'max': 27},
+        {'title': 'Read State from Pin', 'name': 'refresh_state', 'type': 'bool_push', 'value': False},
     ] + comon_parameters_fun(is_multiaxes, axis_names=_axis_names, epsilon=_epsilon)
 
     def ini_attributes(self):
         """Initialize attributes"""
         self.controller = None  # Not needed for GPIO, but kept for consistency
-        self.gpio_relay = GPIORelayWrapper()  # Use our wrapper class
+        self.gpio_relay: GPIORelayWrapper = None  # Created in ini_stage on the configured pin
+        self._initialized_pin: Optional[int] = None  # Pin the GPIO setup was done for
+        self._relay_state_param: Parameter = self.settings.child('relay_state')  # Cached for move_abs/move_home
 
     def ini_stage(self, controller=None):
         """Initialize GPIO pin"""
         self.ini_stage_init(slave_controller=controller)
+        relay_pin = self.settings['relay_pin']
+        if self._initialized_pin == relay_pin:
+            return "Relay already initialized", True
+
+        if self.gpio_relay is None:
+            self.gpio_relay = GPIORelayWrapper(relay_pin)
+        else:
+            self.gpio_relay.change_pin(relay_pin)
+        self._initialized_pin = relay_pin
+        self._update_feedback_pin()
         info = "Relay control initialized"
         initialized = True
         return info, initialized
 
+    def _update_feedback_pin(self):
+        """Watch the feedback pin for external relay changes, or stop watching if disabled."""
+        feedback_pin = self.settings['feedback_pin']
+        if feedback_pin < 0:
+            self.gpio_relay.stop_watch()
+        else:
+            self.gpio_relay.start_watch(feedback_pin)
+
+    def commit_settings(self, param: Parameter):
+        """Apply parameter changes."""
+        if self.gpio_relay is None:
+            return
+        if param.name() == 'relay_pin':
+            self.gpio_relay.change_pin(param.value())
+            self._initialized_pin = param.value()
+            self._relay_state_param.setValue(self._state_strs[0])
+            self._update_feedback_pin()  # change_pin dropped the watch along with the old pin
+        elif param.name() == 'feedback_pin':
+            self._update_feedback_pin()
+        elif param.name() == 'refresh_state' and param.value():
+            # Resync with the hardware, e.g. after the relay line was driven by another process
+            state = self.gpio_relay.refresh_from_hw()
+            self._relay_state_param.setValue(self._state_strs[state])
+            param.setValue(False)
+
     def get_actuator_value(self):
         """Get the current relay state (0 = OFF, 1 = ON)."""
         state = self.gpio_relay.get_state()
@@ -74,18 +445,18 @@ class DAQ_Move_Relay(DAQ_Move_base):
 
     def move_abs(self, value: DataActuator):
         """Switch relay ON/OFF based on the provided value (1 = ON, 0 = OFF)."""
-        # The DataActuator’s value should be 0 or 1.
-        value = int(value.value())
+        # The DataActuator’s value should be 0 or 1, anything else fails safe to OFF
+        value = 1 if int(value.value()) == 1 else 0
         self.gpio_relay.set_state(value)
-        state_str = "ON" if value == 1 else "OFF"
-        self.settings.child('relay_state').setValue(state_str)  # Update UI
-        self.emit_status(ThreadCommand('Update_Status', [f'Relay turned {state_str}']))
+        state_str = self._state_strs[value]
+        self._relay_state_param.setValue(state_str)  # Update UI
+        self.emit_status(ThreadCommand('Update_Status', [self._MSG_TURN[value]]))
 
     def move_home(self):
         """Set relay to OFF (safe home position)."""
         self.gpio_relay.set_state(0)  # Ensure relay is OFF
-        self.settings.child('relay_state').setValue('OFF')
-        self.emit_status(ThreadCommand('Update_Status', ['Relay moved to HOME (OFF)']))
+        self._relay_state_param.setValue('OFF')
+        self.emit_status(self._MSG_HOME)
 
     def stop_motion(self):
         """Turn relay OFF (safe stop)."""
@@ -93,8 +464,11 @@ class DAQ_Move_Relay(DAQ_Move_base):
 
     def close(self):
         """Clean up GPIO when the plugin is closed."""
-        self.gpio_relay.cleanup()
-        self.emit_status(ThreadCommand('Update_Status', ['GPIO cleanup done']))
+        if self.gpio_relay is not None:
+            self.gpio_relay.cleanup()
+            self.gpio_relay = None  # Released, the next ini_stage sets the pin up again
+        self._initialized_pin = None
+        self.emit_status(self._MSG_CLEANUP)
 
 
 if __name__ == '__main__':
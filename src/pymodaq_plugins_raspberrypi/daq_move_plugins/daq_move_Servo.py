@@ -1,44 +1,137 @@
-import subprocess
+import os
+import socket
+import threading
+import time
 from typing import Union
 from pymodaq.control_modules.move_utility_classes import (
     DAQ_Move_base, comon_parameters_fun, main, DataActuatorType, DataActuator
 )
 from pymodaq.utils.daq_utils import ThreadCommand
 from pymodaq.utils.parameter import Parameter
-from gpiozero import Servo
-from gpiozero.pins.pigpio import PiGPIOFactory
 
 
-VALID_GPIO_PINS = [
-    2, 3, 4, 17, 18, 27, 22, 23, 24, 25, 5, 6, 12, 13, 19, 20, 21, 26, 16
-]  # Excludes power, ground, and reserved pins
+VALID_GPIO_PINS = (
+    2, 3, 4, 5, 6, 12, 13, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27
+)  # Excludes power, ground, and reserved pins (sorted, used for messages)
+VALID_GPIO_MASK = sum(1 << pin for pin in VALID_GPIO_PINS)  # Pin p is valid if (VALID_GPIO_MASK >> p) & 1
+# Pins routed to the PWM peripheral and their channel: GPIO12/18 share channel 0, GPIO13/19 channel 1
+HARDWARE_PWM_CHANNELS = {12: 0, 18: 0, 13: 1, 19: 1}
+
+PIGPIOD_PORT = 8888  # Default pigpiod socket port
+
+
+def pigpiod_address():
+    """Address of the pigpiod daemon the pigpio client will use (honours PIGPIO_ADDR/PIGPIO_PORT)."""
+    return os.getenv('PIGPIO_ADDR', 'localhost'), int(os.getenv('PIGPIO_PORT', PIGPIOD_PORT))
+
+
+def pigpiod_running() -> bool:
+    """Check whether pigpiod accepts connections, without forking any process."""
+    try:
+        with socket.create_connection(pigpiod_address(), timeout=0.05):
+            return True
+    except OSError:
+        return False
+
+
+_FACTORY = None
+
+# PWM channels driven by a servo of this process, a second servo on the same channel uses DMA waveforms
+_PWM_CHANNELS_IN_USE: set = set()
+_pwm_lock = threading.Lock()
+
+
+def get_factory():
+    """Return the process-wide pigpio pin factory, so all servos share one pigpiod connection."""
+    global _FACTORY
+    if _FACTORY is None:
+        from gpiozero.pins.pigpio import PiGPIOFactory  # Imported on first use, gpiozero is heavy
+        _FACTORY = PiGPIOFactory()
+    return _FACTORY
+
 
 class ServoWrapper:
-    """Wrapper class to control an SG90 servo motor via GPIO on a Raspberry Pi."""
+    """Wrapper class to control an SG90 servo motor via GPIO on a Raspberry Pi.
+
+    On hardware PWM capable pins the pulses are generated by the PWM peripheral through pigpio,
+    as long as the pin's PWM channel is not already used by another servo. Otherwise gpiozero's
+    Servo (pigpio DMA waveforms) is used.
+    """
+
+    _scale = 1.0 / 90.0  # Angle (0 to 180 degrees) to servo value (-1 to 1): angle * _scale - 1
+    _epsilon = 0.05  # Moves smaller than this (in degrees) are not sent to the servo
+    _frequency = 50  # Hz, 20 ms servo period
+    # Angle to hardware PWM duty cycle (in millionths of the period) for 0.5 ms to 2.5 ms pulses
+    _duty_offset = 500 * _frequency / 1e6 * 1_000_000
+    _duty_scale = 2000 / 180 * _frequency / 1e6 * 1_000_000
 
     def __init__(self, pin: int, default_angle: float):
+        self._pwm_channel = None  # Hardware PWM channel owned by this servo, if any
         try:
-            self.factory = PiGPIOFactory()  # Set up PiGPIO for precise control
-            self.servo = Servo(pin, min_pulse_width=0.0005, max_pulse_width=0.0025, pin_factory=self.factory)
-            self.current_angle = default_angle  # Default position is the neutral position (90 degrees)
+            self.pin = pin
+            self.factory = get_factory()  # PiGPIO for precise control
+            channel = HARDWARE_PWM_CHANNELS.get(pin)
+            with _pwm_lock:
+                if channel is not None and channel not in _PWM_CHANNELS_IN_USE:
+                    _PWM_CHANNELS_IN_USE.add(channel)
+                    self._pwm_channel = channel
+            if self._pwm_channel is not None:
+                self.pi = self.factory.connection  # pigpio.pi shared with the factory
+                self.servo = None
+                self.pi.hardware_PWM(pin, self._frequency, int(self._duty_offset + default_angle * self._duty_scale))
+            else:
+                from gpiozero import Servo
+                self.pi = None
+                self.servo = Servo(pin, initial_value=default_angle * self._scale - 1.0,
+                                   min_pulse_width=0.0005, max_pulse_width=0.0025, pin_factory=self.factory)
+            self.current_angle = default_angle  # Last angle sent to the servo
+            self.target_angle = default_angle  # Last angle commanded, may differ from it by less than _epsilon
         except Exception as e:
+            self._release_channel()
             raise RuntimeError(f"Failed to initialize servo on GPIO pin {pin}: {e}")
 
+    def _release_channel(self):
+        """Make the hardware PWM channel available to other servos again."""
+        if self._pwm_channel is not None:
+            with _pwm_lock:
+                _PWM_CHANNELS_IN_USE.discard(self._pwm_channel)
+            self._pwm_channel = None
+
     def move_to_angle(self, angle: float):
-        """Move the servo to a specific angle (0 to 180 degrees)."""
-        if not 0.0 <= angle <= 180.0:
-            raise ValueError("Angle must be between 0 and 180 degrees.")
+        """Move the servo to a specific angle, clipped to 0 to 180 degrees.
+
+        Targets closer than ``_epsilon`` to the angle last sent are only recorded: relative moves build
+        on :meth:`get_target_angle`, so small steps accumulate until they are worth sending.
+        """
+        angle = 0.0 if angle < 0.0 else 180.0 if angle > 180.0 else angle  # Callers already check_bound
+        if abs(angle - self.current_angle) < self._epsilon:
+            self.target_angle = angle
+            return  # Already there, don't make pigpio regenerate the same pulses
         try:
-            servo_value = (angle / 90) - 1  # Convert angle to servo value (-1 to 1)
-            self.servo.value = servo_value
-            self.current_angle = angle
+            if self.servo is None:
+                self.pi.hardware_PWM(self.pin, self._frequency, int(self._duty_offset + angle * self._duty_scale))
+            else:
+                self.servo.value = angle * self._scale - 1.0
         except Exception as e:
             raise RuntimeError(f"Failed to move servo to angle {angle}: {e}")
+        self.current_angle = self.target_angle = angle
 
     def get_current_angle(self) -> float:
-        """Get the current angle of the servo."""
+        """Get the angle last sent to the servo."""
         return self.current_angle
 
+    def get_target_angle(self) -> float:
+        """Get the angle last commanded, sent or not."""
+        return self.target_angle
+
+    def close(self):
+        """Stop the pulses and release the pin (the shared pigpio connection stays open)."""
+        if self.servo is None:
+            self.pi.hardware_PWM(self.pin, 0, 0)
+            self._release_channel()
+        else:
+            self.servo.close()
+
 
 class DAQ_Move_Servo(DAQ_Move_base):
     """Instrument plugin class for controlling a single SG90 servo motor."""
@@ -49,33 +142,54 @@ class DAQ_Move_Servo(DAQ_Move_base):
     _epsilon: Union[float, list] = 0.1
     data_actuator_type = DataActuatorType["DataActuator"]
 
+    # Status message templates, only formatted when verbose status is enabled
+    _MSG_MOVED = "Servo moved to {:.2f} degrees."
+    _MSG_MOVED_REL = "Servo moved by {:.2f} degrees to {:.2f} degrees."
+    _MSG_HOME = "Servo moved to home position ({:.2f} degrees)."
+
     params = [
         {"title": "GPIO Pin:", "name": "gpio_pin", "type": "int", "value": 17, "min": 0, "max": 40, "step": 1},
         {"title": "Home Position:", "name": "home_position", "type": "float", "value": 0.0, "min": 0.0, "max": 180.0},
         {"title": "Default Angle:", "name": "default_angle", "type": "float", "value": 90.0, "min": 0.0, "max": 180.0, "step": 1.0},
+        {"title": "Verbose Status:", "name": "verbose", "type": "bool", "value": False},
     ] + comon_parameters_fun(is_multiaxes, axis_names=_axis_names, epsilon=_epsilon)
 
     def ini_attributes(self):
         """Initialize attributes, including the servo controller."""
         self.controller: ServoWrapper = None
+        self._home: float = None  # Cached 'home_position' setting
+        self._verbose = False  # Emit a status message after each successful move
 
-    def start_pigpiod_if_needed(self):
-        """Ensure that pigpiod is running before initializing the sensor."""
-        try:
-            subprocess.check_call(['pgrep', 'pigpiod'])
-        except subprocess.CalledProcessError:
-            subprocess.Popen(['sudo', 'pigpiod'])
-            self.emit_status(ThreadCommand("Update_Status", ["Starting pigpiod daemon..."]))
-            
-            # Check if it actually starts
-            import time
-            time.sleep(1)  # Wait for the process to start
-            try:
-                subprocess.check_call(['pgrep', 'pigpiod'])
-                self.emit_status(ThreadCommand("Update_Status", ["Pigpiod started successfully."]))
-            except subprocess.CalledProcessError:
-                self.emit_status(ThreadCommand("Update_Status", ["Error: Failed to start pigpiod."]))
+    def commit_settings(self, param: Parameter):
+        """Apply parameter changes."""
+        if param.name() == 'home_position':
+            self._home = float(param.value())
+        elif param.name() == 'verbose':
+            self._verbose = param.value()
 
+    def start_pigpiod_if_needed(self):
+        """Ensure that pigpiod is running before initializing the servo."""
+        if pigpiod_running():
+            return
+        if pigpiod_address()[0] not in ('localhost', '127.0.0.1', '::1'):
+            self.emit_status(ThreadCommand("Update_Status", ["Error: remote pigpiod is not reachable."]))
+            return
+        self.emit_status(ThreadCommand("Update_Status", ["Starting pigpiod daemon..."]))
+        pid = os.posix_spawnp('sudo', ['sudo', 'pigpiod'], os.environ)
+        # Probe with exponential back-off: pigpiod is usually up within a few tens of ms
+        deadline = time.monotonic() + 2.0
+        delay = 0.01
+        while not pigpiod_running():
+            if time.monotonic() >= deadline:
+                self.emit_status(ThreadCommand("Update_Status", [
+                    "Error: Failed to start pigpiod, enable it with: sudo systemctl enable --now pigpiod"]))
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+        else:
+            self.emit_status(ThreadCommand("Update_Status", ["Pigpiod started successfully."]))
+        # Reap sudo once it exits (pigpiod daemonizes itself), without blocking if it waits for a password
+        threading.Thread(target=os.waitpid, args=(pid, 0), daemon=True).start()
 
     def ini_stage(self, controller=None):
         """Initialize the servo and communication."""
@@ -83,8 +197,10 @@ class DAQ_Move_Servo(DAQ_Move_base):
         
         gpio_pin = self.settings["gpio_pin"]
         default_angle = self.settings["default_angle"]
+        self._home = float(self.settings['home_position'])
+        self._verbose = self.settings['verbose']
 
-        if gpio_pin not in VALID_GPIO_PINS:
+        if not (VALID_GPIO_MASK >> gpio_pin) & 1:
             info = f"Invalid GPIO pin: {gpio_pin}. Please choose a valid GPIO pin."
             self.emit_status(ThreadCommand("Update_Status", [info]))
             return info, False
@@ -107,53 +223,61 @@ class DAQ_Move_Servo(DAQ_Move_base):
         If data is a list, the first element is used.
         If the element is a numpy array, it extracts the scalar.
         """
-        if isinstance(data, list):
+        if type(data) is float:  # Fast path, exact type check
+            return data
+        if type(data) is list:
             data = data[0]
-        if hasattr(data, "item"):
+        try:
             return data.item()
-        return float(data)
+        except AttributeError:
+            return float(data)
 
     def move_abs(self, value: DataActuator):
         """Move the servo to an absolute position (angle in degrees)."""
-        angle = self.extract_value(value.data)
+        angle = self.extract_value(value.value())
         target_angle = self.check_bound(angle)  # Enforce angle limits
         self.target_value = DataActuator(data=target_angle, units=self._controller_units)
         try:
             # Pass the float target_angle directly since move_to_angle expects a float
             self.controller.move_to_angle(target_angle)
-            self.emit_status(ThreadCommand("Update_Status", [f"Servo moved to {target_angle:.2f} degrees."]))
+            if self._verbose:
+                self.emit_status(ThreadCommand("Update_Status", [
+                    self._MSG_MOVED.format(self.controller.get_current_angle())]))
         except RuntimeError as e:
             self.emit_status(ThreadCommand("Update_Status", [f"Error moving servo: {e}"]))
 
     def move_rel(self, value: DataActuator):
         """Move the servo to a position relative to its current position."""
-        current_angle = self.controller.get_current_angle()
-        delta = self.extract_value(value.data)
+        current_angle = self.controller.get_target_angle()  # Steps below the dead band add up
+        delta = self.extract_value(value.value())
         target_angle = self.check_bound(current_angle + delta)  # Enforce limits
         self.target_value = DataActuator(data=target_angle, units=self._controller_units)
         try:
             # Pass the float target_angle directly
             self.controller.move_to_angle(target_angle)
-            self.emit_status(ThreadCommand("Update_Status", [
-                f"Servo moved by {delta:.2f} degrees to {target_angle:.2f} degrees."
-            ]))
+            if self._verbose:
+                self.emit_status(ThreadCommand("Update_Status", [
+                    self._MSG_MOVED_REL.format(delta, self.controller.get_current_angle())]))
         except RuntimeError as e:
             self.emit_status(ThreadCommand("Update_Status", [f"Error moving servo: {e}"]))
 
     def move_home(self):
         """Move the servo to the home position (0 degrees)."""
-        home = self.settings['home_position']
+        home = self._home
         self.target_value = DataActuator(data=home, units=self._controller_units)
         try:
             self.controller.move_to_angle(home)
-            self.emit_status(ThreadCommand("Update_Status", [f"Servo moved to home position ({home:.2f} degrees)."]))
+            if self._verbose:
+                self.emit_status(ThreadCommand("Update_Status", [self._MSG_HOME.format(home)]))
         except RuntimeError as e:
             self.emit_status(ThreadCommand("Update_Status", [f"Error moving servo to home position: {e}"]))
 
     def stop_motion(self):
-        """Stop any ongoing motion of the servo."""
-        current_angle = self.controller.get_current_angle()
-        self.controller.move_to_angle(current_angle)  # Hold position
+        """Stop any ongoing motion of the servo.
+
+        Moves are applied at once by the PWM signal, so there is nothing to interrupt: the servo keeps
+        being driven to its last angle and no pulse update is sent.
+        """
         self.emit_status(ThreadCommand("Update_Status", ["Servo motion stopped."]))
 
     def get_actuator_value(self):
@@ -163,6 +287,9 @@ class DAQ_Move_Servo(DAQ_Move_base):
 
     def close(self):
         """Terminate the communication protocol."""
+        if self.controller is not None:
+            self.controller.close()
+            self.controller = None
         self.emit_status(ThreadCommand("Update_Status", ["Servo communication closed."]))
 
 
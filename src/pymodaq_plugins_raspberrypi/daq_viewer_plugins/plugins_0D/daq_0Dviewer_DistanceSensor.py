@@ -1,38 +1,112 @@
-import subprocess
+"""HC-SR04 ultrasonic distance viewer.
+
+Workload profile: each reading is latency-bound on the echo round trip (up to ~12 ms at 2 m), not
+on CPU. The trigger write and the edge timestamps go through the GPIO character device
+(``hardware.gpio_cdev``) and the shared epoll loop. Enable background sampling to hide the echo wait
+from grab_data.
+"""
+import os
+import threading
+import time
 import numpy as np
 from pymodaq.utils.daq_utils import ThreadCommand
-from pymodaq.utils.data import DataFromPlugins, DataToExport
 from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, comon_parameters, main
 from pymodaq.utils.parameter import Parameter
 
-from gpiozero import DistanceSensor
-from gpiozero.pins.pigpio import PiGPIOFactory
+from pymodaq_plugins_raspberrypi.hardware import gpio_event_loop
+from pymodaq_plugins_raspberrypi.utils import Export0D
+from pymodaq_plugins_raspberrypi.hardware.timerfd import PeriodicTimer
+from pymodaq_plugins_raspberrypi.hardware.gpio_cdev import (
+    GPIOLines, GPIO_V2_LINE_FLAG_INPUT, GPIO_V2_LINE_FLAG_OUTPUT, GPIO_V2_LINE_FLAG_EDGE_RISING,
+    GPIO_V2_LINE_FLAG_EDGE_FALLING, GPIO_V2_LINE_EVENT_RISING_EDGE
+)
+
+VALID_GPIO_PINS = (
+    2, 3, 4, 5, 6, 12, 13, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27
+)  # Excludes power, ground, and reserved pins (sorted, used for messages)
+VALID_GPIO_MASK = sum(1 << pin for pin in VALID_GPIO_PINS)  # Pin p is valid if (VALID_GPIO_MASK >> p) & 1
 
-VALID_GPIO_PINS = [
-    2, 3, 4, 17, 18, 27, 22, 23, 24, 25, 5, 6, 12, 13, 19, 20, 21, 26, 16
-]  # Excludes power, ground, and reserved pins
+SPEED_OF_SOUND = 343.0  # m/s
 
 class DistanceSensorWrapper:
-    """Wrapper for HC-SR04 ultrasonic sensor using gpiozero."""
+    """Wrapper for HC-SR04 ultrasonic sensor using the GPIO character device.
+
+    The echo pulse is timed from the kernel timestamps of its rising and falling edges. The echo
+    line fd is registered with the shared GPIO event loop, so no background polling thread is needed.
+    """
+
+    CM_PER_NS = SPEED_OF_SOUND * 100 / 2 * 1e-9  # Echo width (ns, round trip) to distance (cm)
     
     def __init__(self, trigger_pin: int, echo_pin: int, max_distance: float):
+        self.trigger: GPIOLines = None
+        self.echo: GPIOLines = None
         try:
-            # Create a PinFactory for gpiozero
-            pin_factory = PiGPIOFactory()
             self.trigger_pin = trigger_pin
             self.echo_pin = echo_pin
             self.max_distance = max_distance
-            self.sensor = DistanceSensor(echo=echo_pin, trigger=trigger_pin, pin_factory=pin_factory, max_distance=max_distance)
+            self._max_cm = max_distance * 100
+            self.trigger = GPIOLines([trigger_pin], GPIO_V2_LINE_FLAG_OUTPUT, consumer='hc-sr04 trigger')
+            self.echo = GPIOLines([echo_pin], GPIO_V2_LINE_FLAG_INPUT | GPIO_V2_LINE_FLAG_EDGE_RISING
+                                  | GPIO_V2_LINE_FLAG_EDGE_FALLING, consumer='hc-sr04 echo')
+            os.set_blocking(self.echo.fd, False)  # Drained from the event loop callback
+            self._rising_ns = None
+            self._falling_ns = None
+            self._echo_lock = threading.Lock()  # Callbacks may run concurrently from several waiting threads
+            gpio_event_loop.register(self.echo.fd, self._on_echo)
+            # Longest echo we wait for (round trip at max_distance), plus margin for the sensor start-up
+            self._timeout = 2 * max_distance / SPEED_OF_SOUND + 0.01
         except Exception as e:
+            self.close_communication()  # Release the lines requested before the failure
             raise RuntimeError(f"Failed to initialize sensor on GPIO pins {trigger_pin}, {echo_pin}: {e}")
 
+    def _on_echo(self, fd: int):
+        """Event loop callback: record the timestamps of the echo pulse edges."""
+        with self._echo_lock:  # Keep each edge pair together when two threads drain the fd
+            while True:
+                try:
+                    timestamp_ns, event_id, _ = self.echo.read_event()
+                except BlockingIOError:
+                    return
+                if event_id == GPIO_V2_LINE_EVENT_RISING_EDGE:
+                    self._rising_ns = timestamp_ns
+                    self._falling_ns = None
+                elif self._rising_ns is not None:
+                    self._falling_ns = timestamp_ns
+
     def get_distance(self) -> float:
         """Fetch distance measurement (in cm)."""
-        return self.sensor.distance * 100  # Convert to cm
+        # Drop stale edges left from a previous, timed out measurement
+        self._on_echo(self.echo.fd)
+        with self._echo_lock:
+            self._rising_ns = None
+            self._falling_ns = None
+
+        # 10 µs trigger pulse
+        self.trigger.set_values(1)
+        end = time.perf_counter_ns() + 10_000
+        while time.perf_counter_ns() < end:
+            pass
+        self.trigger.set_values(0)
+
+        deadline = time.perf_counter() + self._timeout
+        while self._falling_ns is None:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return self._max_cm
+            gpio_event_loop.wait(remaining)
+        # Integer nanosecond kernel timestamps, converted to cm once
+        with self._echo_lock:
+            return min((self._falling_ns - self._rising_ns) * self.CM_PER_NS, self._max_cm)
 
     def close_communication(self):
         """Close sensor communication."""
-        self.sensor.close()
+        if self.echo is not None:
+            gpio_event_loop.unregister(self.echo.fd)
+            self.echo.close()
+            self.echo = None
+        if self.trigger is not None:
+            self.trigger.close()
+            self.trigger = None
 
 
 class DAQ_0DViewer_DistanceSensor(DAQ_Viewer_base):
@@ -44,61 +118,98 @@ class DAQ_0DViewer_DistanceSensor(DAQ_Viewer_base):
         {"title": "Trigger Pin:", "name": "trigger_pin", "type": "int", "value": 27, "min": 0, "max": 40, "step": 1},
         {"title": "Echo Pin:", "name": "echo_pin", "type": "int", "value": 22, "min": 0, "max": 40, "step": 1},
         {"title": "Distance Label:", "name": "y_label", "type": "str", "value": "Distance (cm)"},
-        {"title": "Maximum Distance (m):", "name": "max_distance", "type": "float", "value": 2.0, "min": 0.0}
+        {"title": "Maximum Distance (m):", "name": "max_distance", "type": "float", "value": 2.0, "min": 0.0},
+        {"title": "Background Sampling:", "name": "background", "type": "bool", "value": False,
+         "tip": "Measure continuously in a thread, grab_data then returns the latest distance without blocking"},
+        {"title": "Sampling Interval (s):", "name": "sampling_interval", "type": "float", "value": 0.06, "min": 0.01},
     ]
 
     def ini_attributes(self):
         """Initialize attributes."""
         self.controller: DistanceSensorWrapper = None
-    
-    def start_pigpiod_if_needed(self):
-        """Ensure that pigpiod is running before initializing the sensor."""
-        try:
-            subprocess.check_call(['pgrep', 'pigpiod'])
-        except subprocess.CalledProcessError:
-            subprocess.Popen(['sudo', 'pigpiod'])
-            self.emit_status(ThreadCommand("Update_Status", ["Starting pigpiod daemon..."]))
-            
-            # Check if it actually starts
-            import time
-            time.sleep(1)  # Wait for the process to start
+        self._export: Export0D = None  # Built in ini_detector
+        self._samples = np.empty(64, dtype=np.float64)  # Scratch buffer for averaged acquisitions
+        self._latest = 0.0  # Last distance measured by the background sampling thread
+        self._sampling_thread: threading.Thread = None
+        self._stop_sampling = threading.Event()
+        self._timer: PeriodicTimer = None  # Paces the background sampling
+        self._active_pins = None  # (trigger, echo) the controller was built with
+
+    def _sampling_loop(self):
+        """Background sampling: keep the latest distance available for grab_data."""
+        while not self._stop_sampling.is_set():
             try:
-                subprocess.check_call(['pgrep', 'pigpiod'])
-                self.emit_status(ThreadCommand("Update_Status", ["Pigpiod started successfully."]))
-            except subprocess.CalledProcessError:
-                self.emit_status(ThreadCommand("Update_Status", ["Error: Failed to start pigpiod."]))
+                self._latest = self.controller.get_distance()  # A float store is atomic, readers never see a partial value
+            except OSError:
+                break  # Lines released while measuring
+            self._timer.wait()
+
+    def start_sampling(self):
+        """Start the background sampling thread if enabled and not already running."""
+        if not self.settings["background"] or self.controller is None or self._sampling_thread is not None:
+            return
+        self._stop_sampling.clear()
+        self._timer = PeriodicTimer(self.settings["sampling_interval"])
+        self._sampling_thread = threading.Thread(target=self._sampling_loop, daemon=True)
+        self._sampling_thread.start()
+
+    def stop_sampling(self):
+        """Stop the background sampling thread, if running."""
+        if self._sampling_thread is None:
+            return
+        self._stop_sampling.set()
+        self._sampling_thread.join()  # Returns at the latest one tick later
+        self._sampling_thread = None
+        self._timer.close()
+        self._timer = None
 
     def commit_settings(self, param: Parameter):
         """Apply parameter changes dynamically."""
 
         if param.name() == "y_label":
             self.y_axis_label = param.value()
+            if self._export is not None:
+                self._export.label = param.value()
+
+        elif param.name() == "sampling_interval":
+            if self._timer is not None:
+                self._timer.set_interval(param.value())
+
+        elif param.name() == "background":
+            if param.value():
+                self.start_sampling()
+            else:
+                self.stop_sampling()
 
         elif param.name() in ["trigger_pin", "echo_pin"]:
             # Get new pin values
             new_trigger = self.settings["trigger_pin"]
             new_echo = self.settings["echo_pin"]
+            if (new_trigger, new_echo) == self._active_pins:
+                return  # Nothing to rebuild
 
             # Validate new pins
-            if new_trigger not in VALID_GPIO_PINS or new_echo not in VALID_GPIO_PINS:
+            if not (VALID_GPIO_MASK >> new_trigger) & (VALID_GPIO_MASK >> new_echo) & 1:
                 self.emit_status(ThreadCommand("Update_Status", [f"Invalid GPIO pins. Choose from: {VALID_GPIO_PINS}"]))
                 return
 
             # Stop current sensor
+            self.stop_sampling()
             if self.controller:
                 self.controller.close_communication()
+                self._active_pins = None
 
             # Reinitialize sensor with new pins
             try:
-                self.controller = DistanceSensorWrapper(new_trigger, new_echo)
+                self.controller = DistanceSensorWrapper(new_trigger, new_echo, self.settings["max_distance"])
+                self._active_pins = (new_trigger, new_echo)
+                self.start_sampling()
                 self.emit_status(ThreadCommand("Update_Status", [f"Sensor updated: Trigger={new_trigger}, Echo={new_echo}"]))
             except Exception as e:
                 self.emit_status(ThreadCommand("Update_Status", [f"Failed to update sensor: {e}"]))
 
     def ini_detector(self, controller=None):
         """Initialize detector."""
-        self.start_pigpiod_if_needed()  # Ensure pigpiod is running
-    
         self.ini_detector_init(slave_controller=controller)
 
         if self.is_master:
@@ -106,33 +217,36 @@ class DAQ_0DViewer_DistanceSensor(DAQ_Viewer_base):
             echo_pin = self.settings["echo_pin"]
             max_distance = self.settings["max_distance"]
 
-            if trigger_pin not in VALID_GPIO_PINS or echo_pin not in VALID_GPIO_PINS:
+            if not (VALID_GPIO_MASK >> trigger_pin) & (VALID_GPIO_MASK >> echo_pin) & 1:
                 raise ValueError(f"Invalid GPIO pins. Choose from: {VALID_GPIO_PINS}")
 
             self.controller = DistanceSensorWrapper(trigger_pin, echo_pin, max_distance)
+            self._active_pins = (trigger_pin, echo_pin)
+            self.start_sampling()
 
         # Initialize PyMoDAQ viewer with a placeholder value
-        self.dte_signal_temp.emit(DataToExport(name="DistanceSensor",
-                                               data=[DataFromPlugins(name="Distance",
-                                                                     data=[np.array([0])],  # Single 0D data point
-                                                                     dim="Data0D",
-                                                                     labels=[self.settings["y_label"]])]))
+        self._export = Export0D("DistanceSensor", "Distance", self.settings["y_label"])
+        self.dte_signal_temp.emit(self._export.export(0.0))
 
         return "Distance Sensor initialized successfully", True
 
     def grab_data(self, Naverage=1, **kwargs):
         """Acquire data from sensor."""
-        current_distance = self.controller.get_distance()
-        y_data = np.array([current_distance])  # Single value for 0D viewer
-
-        self.dte_signal.emit(DataToExport(name="DistanceSensor",
-                                          data=[DataFromPlugins(name="Distance",
-                                                                data=y_data,
-                                                                dim="Data0D",
-                                                                labels=[self.settings["y_label"]])]))
+        if self._sampling_thread is not None:
+            distance = self._latest
+        elif Naverage <= 1:
+            distance = self.controller.get_distance()
+        else:
+            if Naverage > self._samples.size:
+                self._samples = np.empty(Naverage, dtype=np.float64)
+            for ind in range(Naverage):
+                self._samples[ind] = self.controller.get_distance()
+            distance = self._samples[:Naverage].mean()
+        self.dte_signal.emit(self._export.export(distance))
 
     def close(self):
         """Clean up resources."""
+        self.stop_sampling()
         if self.controller:
             self.controller.close_communication()
         self.emit_status(ThreadCommand("Update_Status", ["Distance Sensor closed."]))
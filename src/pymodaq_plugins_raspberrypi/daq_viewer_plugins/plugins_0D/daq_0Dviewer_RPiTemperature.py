@@ -1,9 +1,19 @@
+"""Raspberry Pi CPU temperature viewer.
+
+Workload profile: each sample is one syscall, a ``pread`` on the kept-open thermal zone sysfs file.
+Vectorizing cannot help a single 0D value, the remaining cost is the driver read itself.
+"""
+import os
+import time
 import numpy as np
-from PyQt5.QtCore import QTimer
 from pymodaq.utils.daq_utils import ThreadCommand
-from pymodaq.utils.data import DataFromPlugins, DataToExport
 from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, comon_parameters, main
 from pymodaq.utils.parameter import Parameter
+from pymodaq.utils.logger import set_logger, get_module_name
+
+from pymodaq_plugins_raspberrypi.utils import Export0D
+
+logger = set_logger(get_module_name(__file__))
 
 class TemperatureSensor:
     """Wrapper for reading the CPU temperature of the Raspberry Pi."""
@@ -11,18 +21,29 @@ class TemperatureSensor:
     def __init__(self):
         """Initialize the temperature sensor (using the CPU temperature file)."""
         self.sensor = "/sys/class/thermal/thermal_zone0/temp"  # Path to the CPU temperature file
+        # Kept open: each pread at offset 0 makes the driver sample the sensor again
+        self.fd = os.open(self.sensor, os.O_RDONLY | os.O_CLOEXEC)
+        self._last_error = float('-inf')  # time.monotonic() of the last logged read error
 
     def get_temperature(self) -> float:
         """Fetch the CPU temperature (in °C)."""
         try:
-            with open(self.sensor, "r") as file:
-                temp_str = file.read().strip()
-                temp = float(temp_str) / 1000  # Convert from millidegrees to degrees Celsius
-                return temp
+            # int() parses the raw bytes (trailing newline included), millidegrees to degrees Celsius
+            return int(os.pread(self.fd, 16, 0)) * 1e-3
         except Exception as e:
-            print(f"Error reading temperature: {e}")
+            # At most one warning per second, a persistently failing zone is read at the grab rate
+            now = time.monotonic()
+            if now - self._last_error >= 1.0:
+                self._last_error = now
+                logger.warning("Error reading temperature: %s", e)
             return None  # Return None if an error occurs
 
+    def close(self):
+        """Close the temperature file."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
 class DAQ_0DViewer_RPiTemperature(DAQ_Viewer_base):
     """
     PyMoDAQ 0D viewer plugin for monitoring the Raspberry Pi CPU temperature.
@@ -35,33 +56,42 @@ class DAQ_0DViewer_RPiTemperature(DAQ_Viewer_base):
     def ini_attributes(self):
         """Initialize attributes."""
         self.controller: TemperatureSensor = None
+        self._export: Export0D = None  # Built in ini_detector
+        self._samples = np.empty(64, dtype=np.float64)  # Scratch buffer for averaged acquisitions
 
     def commit_settings(self, param: Parameter):
         """Apply parameter changes and synchronize sampling settings."""
         if param.name() == "y_label":
             self.y_axis_label = param.value()
+            if self._export is not None:
+                self._export.label = param.value()
 
     def ini_detector(self, controller=None):
         """Initialize detector."""
         if self.is_master:
             self.controller = TemperatureSensor()  # Initialize controller
 
-        self.dte_signal_temp.emit(DataToExport(name="RPi_Temperature",
-                                               data=[DataFromPlugins(name="Temperature",
-                                                                    data=[np.array([0])],
-                                                                    dim="Data0D",
-                                                                    labels=[self.settings["y_label"]])]))
+        self._export = Export0D("RPi_Temperature", "Temperature", self.settings["y_label"])
+        self.dte_signal_temp.emit(self._export.export(0.0))
         return "Raspberry Pi CPU Temperature Sensor initialized", True
 
     def grab_data(self, Naverage=1, **kwargs):
         """Acquire temperature data."""
-        temperature = self.controller.get_temperature()
-        y_data = np.array([temperature])
-        self.dte_signal.emit(DataToExport(name="RPi_Temperature",
-                                          data=[DataFromPlugins(name="Temperature",
-                                                                data=y_data,
-                                                                dim="Data0D",
-                                                                labels=[self.settings["y_label"]])]))
+        if Naverage <= 1:
+            temperature = self.controller.get_temperature()
+            if temperature is None:
+                temperature = np.nan
+        else:
+            # Take the whole batch of samples, then emit once
+            if Naverage > self._samples.size:
+                self._samples = np.empty(Naverage, dtype=np.float64)
+            for ind in range(Naverage):
+                temperature = self.controller.get_temperature()
+                self._samples[ind] = np.nan if temperature is None else temperature
+            samples = self._samples[:Naverage]
+            # nanmean warns on an all-NaN window, the unreadable sensor is already reported by get_temperature
+            temperature = np.nan if np.isnan(samples).all() else np.nanmean(samples)
+        self.dte_signal.emit(self._export.export(temperature))
 
     def stop(self):
         """Clean up resources."""
@@ -69,6 +99,8 @@ class DAQ_0DViewer_RPiTemperature(DAQ_Viewer_base):
 
     def close(self):
         """Close the detector."""
+        if self.controller:
+            self.controller.close()
         self.emit_status(ThreadCommand("Update_Status", ["RPi Temperature Sensor closed."]))
 
 if __name__ == "__main__":
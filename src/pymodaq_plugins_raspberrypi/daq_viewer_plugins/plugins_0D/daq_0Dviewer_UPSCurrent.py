@@ -1,10 +1,9 @@
-import numpy as np
 from pymodaq.utils.daq_utils import ThreadCommand
-from pymodaq.utils.data import DataFromPlugins, DataToExport
 from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, comon_parameters, main
 from pymodaq.utils.parameter import Parameter
 
 from pymodaq_plugins_raspberrypi.hardware.INA219_wrapper import INA219Wrapper
+from pymodaq_plugins_raspberrypi.utils import Export0D
 class DAQ_0DViewer_UPSCurrent(DAQ_Viewer_base):
     """
     PyMoDAQ 0D viewer plugin for monitoring the current drawn from the UPS HAT.
@@ -18,34 +17,28 @@ class DAQ_0DViewer_UPSCurrent(DAQ_Viewer_base):
     def ini_attributes(self):
         """Initialize attributes."""
         self.controller: INA219Wrapper = None
+        self._export: Export0D = None  # Built in ini_detector
 
     def commit_settings(self, param: Parameter):
         """Apply parameter changes and update sampling time."""
         if param.name() == "y_label":
             self.y_axis_label = param.value()
+            if self._export is not None:
+                self._export.label = param.value()
 
     def ini_detector(self, controller=None):
         """Initialize detector."""
         if self.is_master:
-            self.controller = INA219Wrapper() # Initialize controller
+            self.controller = INA219Wrapper.instance()  # Shared with the other UPS viewers
 
         # Emit initial dummy data
-        self.dte_signal_temp.emit(DataToExport(name="UPS_Current",
-                                               data=[DataFromPlugins(name="Current",
-                                                                     data=[np.array([0])],  # Placeholder
-                                                                     dim="Data0D",
-                                                                     labels=[self.settings["y_label"]])]))
+        self._export = Export0D("UPS_Current", "Current", self.settings["y_label"])
+        self.dte_signal_temp.emit(self._export.export(0.0))
         return "UPS Current Sensor initialized successfully", True
 
     def grab_data(self, Naverage=1, **kwargs):
         """Acquire current data from the UPS HAT."""
-        current_mA = self.controller.get_current_mA()
-        y_data = np.array([current_mA])  # Single value for 0D viewer
-        self.dte_signal.emit(DataToExport(name="UPS_Current",
-                                          data=[DataFromPlugins(name="Current",
-                                                                data=y_data,
-                                                                dim="Data0D",
-                                                                labels=[self.settings["y_label"]])]))
+        self.dte_signal.emit(self._export.export(self.controller.snapshot()[1]))  # Current in mA
 
     def stop(self):
         """Stop data acquisition."""
@@ -55,6 +48,7 @@ class DAQ_0DViewer_UPSCurrent(DAQ_Viewer_base):
         """Clean up resources."""
         if self.controller:
             self.controller.close_communication()
+            self.controller = None
         self.emit_status(ThreadCommand("Update_Status", ["UPS Current Sensor closed."]))
 
 if __name__ == "__main__":
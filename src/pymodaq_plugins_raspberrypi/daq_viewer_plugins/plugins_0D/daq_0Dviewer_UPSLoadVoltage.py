@@ -1,10 +1,9 @@
-import numpy as np
 from pymodaq.utils.daq_utils import ThreadCommand
-from pymodaq.utils.data import DataFromPlugins, DataToExport
 from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, comon_parameters, main
 from pymodaq.utils.parameter import Parameter
 
 from pymodaq_plugins_raspberrypi.hardware.INA219_wrapper import INA219Wrapper
+from pymodaq_plugins_raspberrypi.utils import Export0D
 
 class DAQ_0DViewer_UPSLoadVoltage(DAQ_Viewer_base):
     """
@@ -19,34 +18,28 @@ class DAQ_0DViewer_UPSLoadVoltage(DAQ_Viewer_base):
     def ini_attributes(self):
         """Initialize attributes."""
         self.controller: INA219Wrapper = None
+        self._export: Export0D = None  # Built in ini_detector
 
     def commit_settings(self, param: Parameter):
         """Apply parameter changes and update sampling time."""
         if param.name() == "y_label":
             self.y_axis_label = param.value()
+            if self._export is not None:
+                self._export.label = param.value()
 
     def ini_detector(self, controller=None):
         """Initialize detector."""
         if self.is_master:
-            self.controller = INA219Wrapper() # Initialize controller
+            self.controller = INA219Wrapper.instance()  # Shared with the other UPS viewers
 
         # Emit initial dummy data
-        self.dte_signal_temp.emit(DataToExport(name="UPS_Load_Voltage",
-                                               data=[DataFromPlugins(name="Load Voltage",
-                                                                     data=[np.array([0])],  # Placeholder
-                                                                     dim="Data0D",
-                                                                     labels=[self.settings["y_label"]])]))
+        self._export = Export0D("UPS_Load_Voltage", "Load Voltage", self.settings["y_label"])
+        self.dte_signal_temp.emit(self._export.export(0.0))
         return "UPS Load Voltage Sensor initialized successfully", True
 
     def grab_data(self, Naverage=1, **kwargs):
         """Acquire Load Voltage data from the UPS HAT."""
-        bus_voltage_V = self.controller.getBusVoltage_V()
-        y_data = np.array([bus_voltage_V])  # Single value for 0D viewer
-        self.dte_signal.emit(DataToExport(name="UPS_Load_Voltage",
-                                          data=[DataFromPlugins(name="Load Voltage",
-                                                                data=y_data,
-                                                                dim="Data0D",
-                                                                labels=[self.settings["y_label"]])]))
+        self.dte_signal.emit(self._export.export(self.controller.snapshot()[0]))  # Bus voltage in V
 
     def stop(self):
         """Stop data acquisition."""
@@ -56,6 +49,7 @@ class DAQ_0DViewer_UPSLoadVoltage(DAQ_Viewer_base):
         """Clean up resources."""
         if self.controller:
             self.controller.close_communication()
+            self.controller = None
         self.emit_status(ThreadCommand("Update_Status", ["UPS Load Voltage Sensor closed."]))
 
 if __name__ == "__main__":
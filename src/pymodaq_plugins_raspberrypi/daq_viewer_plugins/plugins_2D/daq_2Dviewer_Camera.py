@@ -1,3 +1,4 @@
+import threading
 from qtpy.QtCore import QThread, Slot, QRectF
 from qtpy import QtWidgets
 import numpy as np
@@ -8,6 +9,9 @@ from pymodaq.utils.data import DataFromPlugins, Axis, DataToExport
 from pymodaq.utils.array_manipulation import crop_array_to_axis
 import cv2
 
+RING_SIZE = 8  # Frames kept by the capture thread (grown when Naverage is larger)
+CAPTURE_TIMEOUT = 2.0  # s, maximum wait for the capture thread to deliver the requested frames
+
 
 class DAQ_2DViewer_Camera(DAQ_Viewer_base):
     """Virtual instrument generating 2D data"""
@@ -39,9 +43,100 @@ class DAQ_2DViewer_Camera(DAQ_Viewer_base):
         self.video_capture = cv2.VideoCapture(0)  # Usar a câmera padrão (câmera do PC)
         if not self.video_capture.isOpened():
             raise RuntimeError("Não foi possível acessar a câmera.")
+        # Keep only the latest frame in the driver, the capture thread reads continuously anyway so
+        # backends ignoring this are drained as fast as they deliver
+        self.video_capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         self.x_axis = None
         self.y_axis = None
         self.live = False
+        self._frames: np.ndarray = None  # Ring of the latest frames as delivered (BGR), (slots, Ny, Nx, 3) uint8
+        self._produced = 0  # Frames written to the ring since it was allocated
+        self._acc: np.ndarray = None  # float32 accumulator of average_data, (Ny, Nx, 3)
+        self._frames_cond = threading.Condition()  # Guards the ring and the counters
+        self._capture_thread: threading.Thread = None
+        self._stop_capture = threading.Event()
+        self._capture_error: str = None  # Set by the capture thread when the camera stops delivering frames
+        # Cached settings read by average_data, updated in commit_settings
+        self._threshold = self.settings['threshold']
+        self._n_panels = self.settings['Nimagespannel']
+        self._n_colors = self.settings['Nimagescolor']
+        self._update_axes()
+        self._apply_capture_size()
+
+    def _update_axes(self):
+        """(Re)build the pixel axes for the current Nx, Ny."""
+        self.x_axis = Axis(label='the x axis', data=np.arange(self.settings['Nx'], dtype=np.float64), index=1)
+        self.y_axis = Axis(label='the y axis', data=np.arange(self.settings['Ny'], dtype=np.float64), index=0)
+
+    def _apply_capture_size(self):
+        """Ask the camera for Nx x Ny MJPG frames, so the driver delivers the needed size directly.
+
+        Not thread safe with respect to video_capture.read(), the capture thread must be stopped.
+        """
+        self.video_capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self.video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.settings['Nx'])
+        self.video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.settings['Ny'])
+
+    def start_capture(self):
+        """Start the capture thread, if not already running."""
+        if self._capture_thread is not None and self._capture_thread.is_alive():
+            return
+        self._stop_capture.clear()
+        self._capture_error = None
+        self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._capture_thread.start()
+
+    def stop_capture(self):
+        """Stop the capture thread, if running."""
+        thread = self._capture_thread
+        if thread is None:
+            return
+        self._stop_capture.set()
+        thread.join()  # Returns after the frame being read
+        self._capture_thread = None
+
+    def _alloc_frames(self, n_slots):
+        """(Re)allocate the frame ring for the current Nx, Ny. Call with _frames_cond held."""
+        self._frames = np.zeros((n_slots, self.settings['Ny'], self.settings['Nx'], 3), dtype=np.uint8)
+        self._produced = 0
+
+    def _capture_loop(self):
+        """Capture thread: copy (resized if needed) camera frames into the ring, overwriting the oldest ones."""
+        while not self._stop_capture.is_set():
+            try:
+                ret, frame = self.video_capture.read()
+                if not ret:
+                    self._on_capture_failure("a câmera não entrega mais imagens")
+                    return
+                with self._frames_cond:
+                    Ny, Nx = self._frames.shape[1:3]
+                if frame.shape[:2] != (Ny, Nx):  # The camera doesn't support the requested size
+                    frame = cv2.resize(frame, (Nx, Ny), interpolation=cv2.INTER_AREA)
+                with self._frames_cond:
+                    if self._frames.shape[1:3] == frame.shape[:2]:  # Ring not resized in the meantime
+                        self._frames[self._produced % len(self._frames)] = frame
+                        self._produced += 1
+                        self._frames_cond.notify_all()
+            except Exception as e:  # Any error ends the thread, readers must not wait for the timeout
+                self._on_capture_failure(str(e))
+                return
+
+    def _on_capture_failure(self, reason: str):
+        """Capture thread: the camera stopped delivering frames, wake up the readers so they fail at once."""
+        error = f"Erro ao capturar o frame da câmera ({reason})."
+        with self._frames_cond:
+            self._capture_error = error
+            self._frames_cond.notify_all()
+        self.emit_status(ThreadCommand('Update_Status', [error, 'log']))
+
+    def _wait_frames(self, n_frames: int, timeout: float):
+        """Wait until n_frames were written to the ring, raise if the capture failed or timed out.
+
+        Call with _frames_cond held.
+        """
+        if not self._frames_cond.wait_for(lambda: self._produced >= n_frames or self._capture_error is not None,
+                                          timeout) or self._capture_error is not None:
+            raise RuntimeError(self._capture_error or "Erro ao capturar o frame da câmera.")
 
     @Slot(QRectF)
     def ROISelect(self, roi_pos_size: QRectF):
@@ -62,29 +157,30 @@ class DAQ_2DViewer_Camera(DAQ_Viewer_base):
             --------
             set_Mock_data
         """
-        self.set_Mock_data()
+        if param.name() == 'threshold':
+            self._threshold = param.value()
+        elif param.name() == 'Nimagespannel':
+            self._n_panels = param.value()
+        elif param.name() == 'Nimagescolor':
+            self._n_colors = param.value()
+        elif param.name() in ('Nx', 'Ny'):
+            self._update_axes()
+        if param.name() in ('Nx', 'Ny') and self._capture_thread is not None:
+            self.stop_capture()
+            self._apply_capture_size()
+            with self._frames_cond:
+                self._alloc_frames(len(self._frames))
+            self.start_capture()
 
 
 
     def set_Mock_data(self):
         """
-        Substituir o mock data por frames capturados da câmera.
+        Substituir o mock data pelo último frame capturado da câmera.
         """
-        # Ler frame da câmera
-        ret, frame = self.video_capture.read()
-        if not ret:
-            raise RuntimeError("Erro ao capturar o frame da câmera.")
-
-        
-        # Converter para escala de cinza e redimensionar
-        #frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        Nx = self.settings.child('Nx').value()
-        Ny = self.settings.child('Ny').value()
-        frame_rgb = cv2.resize(frame_rgb, (Nx, Ny), interpolation=cv2.INTER_AREA)
-        self.image = frame_rgb
-        self.x_axis = Axis(label='the x axis', data=np.linspace(0, Nx, Nx, endpoint=False), index=1)
-        self.y_axis = Axis(label='the y axis', data=np.linspace(0, Ny, Ny, endpoint=False), index=0)
+        with self._frames_cond:
+            self._wait_frames(1, CAPTURE_TIMEOUT)
+            self.image = self._frames[(self._produced - 1) % len(self._frames), :, :, ::-1].copy()  # RGB
 
         return self.image
 
@@ -92,6 +188,10 @@ class DAQ_2DViewer_Camera(DAQ_Viewer_base):
     def ini_detector(self, controller=None):
         self.ini_detector_init(controller, "Mock controller")
 
+        with self._frames_cond:
+            self._alloc_frames(RING_SIZE)
+        self.start_capture()
+
         self.x_axis = self.get_xaxis()
         self.y_axis = self.get_yaxis()
 
@@ -106,16 +206,19 @@ class DAQ_2DViewer_Camera(DAQ_Viewer_base):
         """
         Libera a câmera ao fechar o programa.
         """
+        self.stop_capture()
         if hasattr(self, "video_capture") and self.video_capture.isOpened():
             self.video_capture.release()
 
 
     def get_xaxis(self):
-        self.set_Mock_data()
+        if self.x_axis is None:
+            self._update_axes()
         return self.x_axis
 
     def get_yaxis(self):
-        self.set_Mock_data()
+        if self.y_axis is None:
+            self._update_axes()
         return self.y_axis
 
     def grab_data(self, Naverage=1, **kwargs):
@@ -153,19 +256,31 @@ class DAQ_2DViewer_Camera(DAQ_Viewer_base):
 
     def average_data(self, Naverage, init=False):
         data = []  # list of image (at most 3 for red, green and blue channels)
-        data_tmp = np.zeros_like(self.image)
-        
-        for ind in range(Naverage):
-            data_tmp += self.set_Mock_data()
-        data_tmp = data_tmp / Naverage
-
-        data_tmp = data_tmp * (data_tmp >= self.settings['threshold']) * (init is False)
-        data_tmp = np.flipud(np.fliplr(data_tmp))
+        with self._frames_cond:
+            if Naverage > len(self._frames):
+                self._alloc_frames(Naverage)
+            # Average the newest frames without waiting for new ones, only a freshly allocated ring
+            # has to fill first
+            self._wait_frames(Naverage, CAPTURE_TIMEOUT * Naverage)
+            if self._acc is None or self._acc.shape != self._frames.shape[1:]:
+                self._acc = np.empty(self._frames.shape[1:], dtype=np.float32)
+            # Sum the newest Naverage frames in place with OpenCV's vectorized accumulator
+            self._acc.fill(0)
+            for ind in range(Naverage):
+                cv2.accumulate(self._frames[(self._produced - 1 - ind) % len(self._frames)], self._acc)
+        # Mean, rounded and saturated to uint8: the only new array, emitted data must not be reused
+        data_tmp = cv2.convertScaleAbs(self._acc, alpha=1.0 / Naverage)
+
+        if init:
+            data_tmp.fill(0)
+        else:
+            cv2.threshold(data_tmp, self._threshold - 1, 0, cv2.THRESH_TOZERO, dst=data_tmp)  # Keeps >= threshold
+        data_tmp = data_tmp[::-1, ::-1, ::-1]  # Flipped view with BGR to RGB channel order, no copy
 
         
-        for ind in range(self.settings['Nimagespannel']):
+        for ind in range(self._n_panels):
             datatmptmp = []
-            for indbis in range(self.settings['Nimagescolor']):
+            for indbis in range(self._n_colors):
                 #datatmptmp.append(data_tmp)
                 datatmptmp.append(data_tmp[:,:,indbis])
             data.append(DataFromPlugins(name='Mock2D_{:d}'.format(ind), data=datatmptmp, dim='Data2D',
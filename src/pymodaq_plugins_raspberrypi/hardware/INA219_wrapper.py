@@ -1,4 +1,15 @@
-import smbus
+import threading
+import time
+
+from smbus2 import SMBus, i2c_msg
+from pymodaq_plugins_raspberrypi.hardware.timerfd import PeriodicTimer
+from pymodaq.utils.logger import set_logger, get_module_name
+
+logger = set_logger(get_module_name(__file__))
+
+# Results are refreshed once per conversion cycle (bus + shunt ADCs, 12 bit 32 samples: ~34 ms), reads
+# within that window return the same values
+SNAPSHOT_MAX_AGE = 0.034
 
 # INA219 register addresses
 _REG_CONFIG       = 0x00 # Config Register (R/W)
@@ -45,49 +56,129 @@ class Mode:
     BVOLT_CONTINUOUS        = 0x06      # bus voltage continuous
     SANDBVOLT_CONTINUOUS    = 0x07      # shunt and bus voltage continuous
 
+# Config register value written by set_calibration_32V_2A
+_CONFIG_32V_2A = BusVoltageRange.RANGE_32V << 13 | \
+                 Gain.DIV_8_320MV << 11 | \
+                 ADCResolution.ADCRES_12BIT_32S << 7 | \
+                 ADCResolution.ADCRES_12BIT_32S << 3 | \
+                 Mode.SANDBVOLT_CONTINUOUS
+
+# Waveshare UPS HATs (0x42: UPS HAT, 0x43: UPS HAT (C)), then the INA219 default addresses
+KNOWN_INA219_ADDRS = (0x42, 0x43, 0x40, 0x41)
+
+_found_addresses = {}  # i2c_bus -> address found by find_ina219_address
+
+FAST_MODE_HZ = 400_000  # I²C fast mode, supported by the INA219
+
+def i2c_bus_frequency(i2c_bus=1):
+    """Return the I²C bus clock in Hz from the device tree, None if not available."""
+    try:
+        with open(f"/sys/class/i2c-adapter/i2c-{i2c_bus}/of_node/clock-frequency", "rb") as f:
+            return int.from_bytes(f.read(4), "big")  # Device tree cells are big endian u32
+    except OSError:
+        return None
+
 def find_ina219_address(i2c_bus=1):
-    """Scan the I²C bus for devices and return the first detected address."""
-    bus = smbus.SMBus(i2c_bus)
-    for addr in range(0x03, 0x77):  # Valid I²C address range
-        try:
-            bus.write_quick(addr)  # Quick test to see if a device responds
-            return addr
-        except OSError:
-            continue
-    print("DEBUG: No INA219 device found on the I²C bus.")
+    """Return the address of the first responding device, known INA219 addresses first, then the
+    whole I²C address range. The result is cached per bus."""
+    if i2c_bus in _found_addresses:
+        return _found_addresses[i2c_bus]
+    bus = SMBus(i2c_bus)
+    try:
+        for addr in (*KNOWN_INA219_ADDRS, *range(0x03, 0x77)):  # Valid I²C address range
+            try:
+                bus.write_quick(addr)  # Quick test to see if a device responds
+                _found_addresses[i2c_bus] = addr
+                return addr
+            except OSError:
+                continue
+    finally:
+        bus.close()
+    logger.warning("No INA219 device found on the I²C bus.")
     return None
 
 class INA219Wrapper:
     """Wrapper for reading current from the UPS HAT using INA219."""
+
+    _instances = {}  # (i2c_bus, addr) -> [wrapper, number of users], see instance()
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls, i2c_bus=1, addr=None) -> 'INA219Wrapper':
+        """Return the wrapper shared for this bus and address, opening and calibrating the device on
+        first use.
+
+        Each call must be balanced by a call to :meth:`close_communication`, the bus is closed when
+        the last user releases it. Shared wrappers poll the device in the background (see
+        :meth:`start_polling`), so :meth:`snapshot` never waits on the bus.
+        """
+        with cls._instance_lock:
+            if addr is None:
+                # Resolved first so auto-detecting and explicit users share the entry (still None if
+                # nothing answers, __init__ then reports it)
+                addr = find_ina219_address(i2c_bus)
+            key = (i2c_bus, addr)
+            entry = cls._instances.get(key)
+            if entry is None:
+                wrapper = cls(i2c_bus, addr)
+                try:
+                    wrapper.start_polling()
+                except Exception:
+                    wrapper.bus.close()
+                    raise
+                wrapper._pool_key = key
+                entry = cls._instances[key] = [wrapper, 0]
+            entry[1] += 1
+            return entry[0]
     
     def __init__(self, i2c_bus=1, addr=None):
         try:
-            self.bus = smbus.SMBus(i2c_bus)
+            self.bus = SMBus(i2c_bus)
         except Exception as e:
             raise RuntimeError(f"Failed to open I2C bus {i2c_bus}: {e}")
-        
-        # Auto-detect the I²C address if not provided
-        self.addr = addr if addr is not None else find_ina219_address(i2c_bus)
-        if self.addr is None:
-            raise RuntimeError("No INA219 device found on the I²C bus!")
-        print(f"DEBUG: Using INA219 device at address: {hex(self.addr)}")
+        try:
+            # Auto-detect the I²C address if not provided
+            self.addr = addr if addr is not None else find_ina219_address(i2c_bus)
+            if self.addr is None:
+                raise RuntimeError("No INA219 device found on the I²C bus!")
+            logger.debug("Using INA219 device at address: %#x", self.addr)
+            frequency = i2c_bus_frequency(i2c_bus)
+            if frequency is not None and frequency < FAST_MODE_HZ:
+                logger.warning("I²C bus %d runs at %d Hz, set dtparam=i2c_arm_baudrate=400000 in /boot/config.txt "
+                               "for faster INA219 reads", i2c_bus, frequency)
 
-        self._cal_value = 0
-        self._current_lsb = 0
-        self._power_lsb = 0
-        self.set_calibration_32V_2A()
+            self._cal_value = 0
+            self._current_lsb = 0
+            self._power_lsb = 0
+            self._pool_key = None  # Set by instance() for shared wrappers
+            self._read_lock = threading.Lock()  # The UPS viewers may grab from different threads
+            self._snapshot = (0.0, 0.0, 0.0)
+            self._snapshot_time = float('-inf')
+            self._poll_thread: threading.Thread = None
+            self._stop_polling = threading.Event()
+            self._poll_timer: PeriodicTimer = None  # Paces the background polling
+            self.set_calibration_32V_2A()
+        except Exception:
+            self.bus.close()  # Don't leak the bus fd when no device answers or calibration fails
+            raise
 
     def read(self, address):
-        data = self.bus.read_i2c_block_data(self.addr, address, 2)
-        return ((data[0] * 256) + data[1])
+        # Register pointer write and 2-byte read as one repeated-START transaction (single ioctl)
+        pointer = i2c_msg.write(self.addr, [address])
+        data = i2c_msg.read(self.addr, 2)
+        self.bus.i2c_rdwr(pointer, data)
+        msb, lsb = data
+        return (msb << 8) | lsb
+
+    def read_signed(self, address):
+        # Registers holding a 16-bit two's complement value
+        value = self.read(address)
+        return value - 0x10000 if value & 0x8000 else value
 
     def write(self, address, data):
-        temp = [0,0]
-        temp[1] = data & 0xFF
-        temp[0] =(data & 0xFF00) >> 8
-        self.bus.write_i2c_block_data(self.addr,address,temp)
         try:
-            self.bus.write_i2c_block_data(self.addr, address, temp)
+            # Register pointer then MSB, LSB as one raw 3-byte I²C write, as in the INA219 datasheet
+            self.bus.i2c_rdwr(i2c_msg.write(self.addr, [address, (data >> 8) & 0xFF, data & 0xFF]))
         except Exception as e:
             raise IOError(f"I2C write error at register {hex(address)}: {e}")
 
@@ -104,47 +195,101 @@ class INA219Wrapper:
         self.write(_REG_CALIBRATION,self._cal_value)
         
         # Set Config register to take into account the settings above
-        self.bus_voltage_range = BusVoltageRange.RANGE_32V
-        self.gain = Gain.DIV_8_320MV
-        self.bus_adc_resolution = ADCResolution.ADCRES_12BIT_32S
-        self.shunt_adc_resolution = ADCResolution.ADCRES_12BIT_32S
-        self.mode = Mode.SANDBVOLT_CONTINUOUS
-        self.config = self.bus_voltage_range << 13 | \
-                      self.gain << 11 | \
-                      self.bus_adc_resolution << 7 | \
-                      self.shunt_adc_resolution << 3 | \
-                      self.mode
+        self.config = _CONFIG_32V_2A
         self.write(_REG_CONFIG,self.config)
     
     def getShuntVoltage_mV(self):
         """Return the shunt voltage in mV."""
         self.write(_REG_CALIBRATION,self._cal_value)
-        value = self.read(_REG_SHUNTVOLTAGE)
-        if value > 32767:
-            value -= 65535
-        return value * 0.01
+        return self.read_signed(_REG_SHUNTVOLTAGE) * 0.01
 
     def getBusVoltage_V(self):
         """Return the bus voltage in V."""
         self.write(_REG_CALIBRATION,self._cal_value)
-        self.read(_REG_BUSVOLTAGE)
         return (self.read(_REG_BUSVOLTAGE) >> 3) * 0.004
 
     def get_current_mA(self):
         """Return the measured current in mA."""
-        value = self.read(_REG_CURRENT)
-        if value > 32767:
-            value -= 65535
-        return value * self._current_lsb
+        return self.read_signed(_REG_CURRENT) * self._current_lsb
 
     def getPower_W(self):
         """Return the power in W."""
         self.write(_REG_CALIBRATION,self._cal_value)
-        value = self.read(_REG_POWER)
-        if value > 32767:
-            value -= 65535
-        return value * self._power_lsb
+        return self.read(_REG_POWER) * self._power_lsb  # Unsigned, unlike shunt voltage and current
+
+    def read_all(self):
+        """Return (bus voltage in V, current in mA, power in W) from a single calibration refresh.
+
+        The INA219 register pointer does not auto-increment, so each register still needs its own
+        2-byte read, but the calibration write is shared instead of repeated per quantity.
+        """
+        self.write(_REG_CALIBRATION, self._cal_value)
+        bus = self.read(_REG_BUSVOLTAGE)
+        current = self.read_signed(_REG_CURRENT)
+        power = self.read(_REG_POWER)  # Unsigned
+        return (bus >> 3) * 0.004, current * self._current_lsb, power * self._power_lsb
+
+    def snapshot(self, max_age: float = SNAPSHOT_MAX_AGE):
+        """Return (bus voltage in V, current in mA, power in W), read with :meth:`read_all` at most
+        once every ``max_age`` seconds.
+
+        Viewers sharing the wrapper then share a single set of I2C transactions per sample.
+        """
+        with self._read_lock:
+            now = time.monotonic()
+            if self._poll_thread is None and now - self._snapshot_time >= max_age:
+                self._snapshot = self.read_all()
+                self._snapshot_time = now
+            return self._snapshot
+
+    def _poll_loop(self):
+        """Background polling: keep the snapshot refreshed at the conversion rate."""
+        failing = False
+        while not self._stop_polling.is_set():
+            try:
+                values = self.read_all()
+            except OSError as e:
+                if not failing:  # Log once per failure streak, not at the polling rate
+                    logger.warning("Error reading INA219: %s", e)
+                failing = True
+            else:
+                failing = False
+                with self._read_lock:
+                    self._snapshot = values  # Replaced as a whole, readers never see a mixed tuple
+                    self._snapshot_time = time.monotonic()
+            self._poll_timer.wait()
+
+    def start_polling(self, interval: float = SNAPSHOT_MAX_AGE):
+        """Refresh the snapshot from a background thread every ``interval`` seconds, if not already
+        polling. :meth:`snapshot` then returns the latest values without touching the bus."""
+        if self._poll_thread is not None:
+            return
+        with self._read_lock:
+            self._snapshot = self.read_all()  # Valid values before the first tick
+            self._snapshot_time = time.monotonic()
+        self._stop_polling.clear()
+        self._poll_timer = PeriodicTimer(interval)
+        self._poll_thread = threading.Thread(target=self._poll_loop, daemon=True)
+        self._poll_thread.start()
+
+    def stop_polling(self):
+        """Stop the background polling thread, if running."""
+        if self._poll_thread is None:
+            return
+        self._stop_polling.set()
+        self._poll_thread.join()  # Returns at the latest one tick later
+        self._poll_thread = None
+        self._poll_timer.close()
+        self._poll_timer = None
 
     def close_communication(self):
-        """Close the I2C bus."""
-        self.bus.close()
+        """Close the I2C bus (for the shared instance, only once its last user released it)."""
+        with self._instance_lock:
+            entry = self._instances.get(self._pool_key)
+            if entry is not None and entry[0] is self:
+                entry[1] -= 1
+                if entry[1] > 0:
+                    return
+                del self._instances[self._pool_key]
+            self.stop_polling()
+            self.bus.close()
@@ -0,0 +1,97 @@
+import fcntl
+import os
+import struct
+
+# GPIO character device uAPI v2 (linux/gpio.h)
+GPIO_V2_LINE_FLAG_ACTIVE_LOW   = 1 << 1
+GPIO_V2_LINE_FLAG_INPUT        = 1 << 2
+GPIO_V2_LINE_FLAG_OUTPUT       = 1 << 3
+GPIO_V2_LINE_FLAG_EDGE_RISING  = 1 << 4
+GPIO_V2_LINE_FLAG_EDGE_FALLING = 1 << 5
+
+GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES = 2
+
+GPIO_V2_LINE_EVENT_RISING_EDGE  = 1
+GPIO_V2_LINE_EVENT_FALLING_EDGE = 2
+
+_GPIO_V2_LINES_MAX = 64
+_GPIO_V2_LINE_NUM_ATTRS_MAX = 10
+
+# struct gpio_v2_line_request: offsets, consumer, config (flags, num_attrs, padding, attrs), num_lines,
+# event_buffer_size, padding, fd
+_LINE_REQUEST = struct.Struct('=64I32sQI5I' + 'IIQQ' * _GPIO_V2_LINE_NUM_ATTRS_MAX + 'II5Ii')
+_LINE_VALUES = struct.Struct('=QQ')  # struct gpio_v2_line_values: bits, mask
+_LINE_EVENT = struct.Struct('=QIIII6I')  # struct gpio_v2_line_event: timestamp_ns, id, offset, seqno, line_seqno
+
+
+def _iowr(nr: int, size: int) -> int:
+    return (3 << 30) | (size << 16) | (0xB4 << 8) | nr
+
+
+GPIO_V2_GET_LINE_IOCTL = _iowr(0x07, _LINE_REQUEST.size)
+GPIO_V2_LINE_GET_VALUES_IOCTL = _iowr(0x0E, _LINE_VALUES.size)
+GPIO_V2_LINE_SET_VALUES_IOCTL = _iowr(0x0F, _LINE_VALUES.size)
+
+
+def pack_values(bits: int, mask: int = 1) -> bytes:
+    """Prebuild a ``gpio_v2_line_values`` buffer for :meth:`GPIOLines.write_values`."""
+    return _LINE_VALUES.pack(bits, mask)
+
+
+class GPIOLines:
+    """Lines requested from a GPIO character device (``/dev/gpiochipN``) through the v2 uAPI.
+
+    The request is done once, afterwards each read/write is a single ioctl on the returned line fd
+    and edge events (with kernel timestamps) are read from the same fd.
+    """
+
+    def __init__(self, offsets, flags: int, chip: int = 0, consumer: str = 'pymodaq', output_values: int = 0):
+        offsets = list(offsets)
+        attrs = [0] * (4 * _GPIO_V2_LINE_NUM_ATTRS_MAX)
+        num_attrs = 0
+        if flags & GPIO_V2_LINE_FLAG_OUTPUT:
+            # Initial output values, applied to all requested lines
+            attrs[0:4] = [GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES, 0, output_values, (1 << len(offsets)) - 1]
+            num_attrs = 1
+        request = bytearray(_LINE_REQUEST.pack(
+            *(offsets + [0] * (_GPIO_V2_LINES_MAX - len(offsets))),
+            consumer.encode()[:31],
+            flags, num_attrs, *([0] * 5),
+            *attrs,
+            len(offsets), 0, *([0] * 5), 0))
+
+        chip_fd = os.open(f'/dev/gpiochip{chip}', os.O_RDWR | os.O_CLOEXEC)
+        try:
+            fcntl.ioctl(chip_fd, GPIO_V2_GET_LINE_IOCTL, request)
+        finally:
+            os.close(chip_fd)  # The line fd stays valid on its own
+        self.offsets = offsets
+        self.fd = _LINE_REQUEST.unpack(request)[-1]
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def set_values(self, bits: int, mask: int = 1):
+        """Set the output values of the lines selected by ``mask`` (bit i is the i-th requested line)."""
+        self.write_values(pack_values(bits, mask))
+
+    def write_values(self, values: bytes):
+        """Set output values from a buffer prebuilt with :func:`pack_values` (a single ioctl)."""
+        fcntl.ioctl(self.fd, GPIO_V2_LINE_SET_VALUES_IOCTL, values)
+
+    def get_values(self, mask: int = 1) -> int:
+        """Return the values of the lines selected by ``mask`` as a bit field."""
+        buf = bytearray(_LINE_VALUES.pack(0, mask))
+        fcntl.ioctl(self.fd, GPIO_V2_LINE_GET_VALUES_IOCTL, buf)
+        return _LINE_VALUES.unpack(buf)[0]
+
+    def read_event(self):
+        """Read one edge event, blocking until available. Returns (timestamp_ns, event_id, offset)."""
+        timestamp_ns, event_id, offset, *_ = _LINE_EVENT.unpack(os.read(self.fd, _LINE_EVENT.size))
+        return timestamp_ns, event_id, offset
+
+    def close(self):
+        """Release the requested lines."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
@@ -0,0 +1,57 @@
+import select
+import threading
+
+class GpioEventLoop:
+    """One epoll set shared by every GPIO line fd of the process.
+
+    Each registered fd comes with a callback, called with the fd when it becomes readable. Waiting
+    on several sensors then costs a single ``epoll_wait`` instead of one poll per sensor.
+    Callbacks may be dispatched from whichever thread is waiting, possibly from two threads at once
+    for the same fd, so they should only drain their (non-blocking) fd and record state under a lock
+    of their own.
+    """
+
+    def __init__(self):
+        self._epoll = select.epoll()
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def register(self, fd: int, callback):
+        """Watch ``fd`` for readability and call ``callback(fd)`` when it is."""
+        with self._lock:
+            self._epoll.register(fd, select.EPOLLIN)
+            self._callbacks[fd] = callback
+
+    def unregister(self, fd: int):
+        """Stop watching ``fd``."""
+        with self._lock:
+            if self._callbacks.pop(fd, None) is not None:
+                self._epoll.unregister(fd)
+
+    def wait(self, timeout: float) -> int:
+        """Wait up to ``timeout`` seconds for events, dispatch them and return how many fired."""
+        events = self._epoll.poll(timeout)
+        for fd, _ in events:
+            callback = self._callbacks.get(fd)
+            if callback is not None:
+                callback(fd)
+        return len(events)
+
+
+_loop = None
+
+def get_event_loop() -> GpioEventLoop:
+    """Return the process-wide event loop, creating it on first use."""
+    global _loop
+    if _loop is None:
+        _loop = GpioEventLoop()
+    return _loop
+
+def register(fd: int, callback):
+    get_event_loop().register(fd, callback)
+
+def unregister(fd: int):
+    get_event_loop().unregister(fd)
+
+def wait(timeout: float) -> int:
+    return get_event_loop().wait(timeout)
@@ -0,0 +1,63 @@
+import ctypes
+import os
+
+CLOCK_MONOTONIC = 1
+TFD_CLOEXEC = 0o2000000
+
+_libc = None  # Loaded on first use, so importing this module doesn't need a POSIX libc
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+    return _libc
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+class _Itimerspec(ctypes.Structure):
+    _fields_ = [('it_interval', _Timespec), ('it_value', _Timespec)]
+
+
+def _timespec(seconds: float) -> _Timespec:
+    # Round once in nanoseconds so tv_nsec always stays below one second
+    sec, nsec = divmod(round(seconds * 1e9), 1_000_000_000)
+    return _Timespec(sec, nsec)
+
+
+class PeriodicTimer:
+    """Kernel periodic timer (``timerfd``) on the monotonic clock.
+
+    Ticks are scheduled by the kernel, so the period doesn't drift with the time spent between
+    two waits. The fd can also be registered with an epoll set.
+    """
+
+    def __init__(self, interval: float):
+        self._libc = _get_libc()
+        self.fd = self._libc.timerfd_create(CLOCK_MONOTONIC, TFD_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.set_interval(interval)
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def set_interval(self, interval: float):
+        """(Re)arm the timer, first tick after ``interval`` seconds."""
+        spec = _Itimerspec(_timespec(interval), _timespec(interval))
+        if self._libc.timerfd_settime(self.fd, 0, ctypes.byref(spec), None) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def wait(self) -> int:
+        """Block until the next tick, return the number of ticks elapsed since the previous wait."""
+        return int.from_bytes(os.read(self.fd, 8), 'little')
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
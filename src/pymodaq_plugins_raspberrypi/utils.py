@@ -4,12 +4,52 @@ Created the 31/08/2023
 
 @author: Sebastien Weber
 """
+import time
 from pathlib import Path
 
+import numpy as np
 from pymodaq.utils.config import BaseConfig, USER
+from pymodaq.utils.data import DataFromPlugins, DataToExport
 
 
 class Config(BaseConfig):
     """Main class to deal with configuration values for this plugin"""
     config_template_path = Path(__file__).parent.joinpath('resources/config_template.toml')
     config_name = f"config_{__package__.split('pymodaq_plugins_')[1]}"
+
+
+class Export0D:
+    """Export of the 0D viewers emitting a single value per grab.
+
+    Two DataFromPlugins/DataToExport pairs are built once, each wrapping its own one element buffer.
+    A grab writes its value in the next pair, alternately, and refreshes its timestamps, so nothing is
+    allocated per grab. Two pairs are enough because the detector thread waits for each export to be
+    emitted before grabbing again: a pair is only rewritten two grabs after the data it holds was sent.
+    """
+
+    def __init__(self, name: str, data_name: str, label: str):
+        self._slots = []
+        for _ in range(2):
+            buf = np.zeros(1, dtype=np.float64)
+            dfp = DataFromPlugins(name=data_name, data=[buf], dim="Data0D", labels=[label])
+            self._slots.append((buf, dfp, DataToExport(name=name, data=[dfp])))
+        self._label = label
+        self._tick = 0
+
+    @property
+    def label(self) -> str:
+        return self._label
+
+    @label.setter
+    def label(self, label: str):
+        self._label = label
+        for _, dfp, _ in self._slots:
+            dfp.labels = [label]
+
+    def export(self, value: float) -> DataToExport:
+        """Store ``value`` in the next buffer and return its DataToExport, timestamped now."""
+        self._tick ^= 1
+        buf, dfp, dte = self._slots[self._tick]
+        buf[0] = value
+        dfp.timestamp = dte.timestamp = time.time()
+        return dte
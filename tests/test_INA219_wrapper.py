@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the INA219 wrapper against a fake I²C bus (no hardware needed).
+"""
+import time
+
+import pytest
+
+pytest.importorskip("pymodaq")  # Imported by the package __init__
+pytest.importorskip("smbus2")
+
+from pymodaq_plugins_raspberrypi.hardware import INA219_wrapper
+from pymodaq_plugins_raspberrypi.hardware.INA219_wrapper import (
+    INA219Wrapper, _REG_BUSVOLTAGE, _REG_CURRENT, _REG_POWER, _REG_SHUNTVOLTAGE
+)
+
+ADDR = 0x42
+
+
+class FakeI2CMsg:
+    """Stand-in for smbus2.i2c_msg: plain lists the fake bus reads or fills."""
+
+    @staticmethod
+    def write(addr, data):
+        return ('w', addr, list(data))
+
+    @staticmethod
+    def read(addr, length):
+        return [0] * length
+
+
+class FakeSMBus:
+    """INA219 register file behind a fake SMBus, records every bus opened."""
+
+    opened = []
+    fail_reads = False
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.closed = False
+        self.registers = {}
+        self.pointer = 0
+        FakeSMBus.opened.append(self)
+
+    def i2c_rdwr(self, *msgs):
+        if self.closed:
+            raise OSError("bus closed")
+        for msg in msgs:
+            if isinstance(msg, tuple):
+                _, _, data = msg
+                self.pointer = data[0]
+                if len(data) == 3:
+                    self.registers[self.pointer] = (data[1] << 8) | data[2]
+            else:
+                if FakeSMBus.fail_reads:
+                    raise OSError("remote I/O error")
+                value = self.registers.get(self.pointer, 0)
+                msg[0], msg[1] = value >> 8, value & 0xFF
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_bus(monkeypatch):
+    monkeypatch.setattr(INA219_wrapper, 'SMBus', FakeSMBus)
+    monkeypatch.setattr(INA219_wrapper, 'i2c_msg', FakeI2CMsg)
+    monkeypatch.setattr(INA219Wrapper, '_instances', {})
+    monkeypatch.setattr(FakeSMBus, 'opened', [])
+    monkeypatch.setattr(FakeSMBus, 'fail_reads', False)
+
+
+def test_polling_refreshes_snapshot():
+    wrapper = INA219Wrapper.instance(1, ADDR)
+    try:
+        assert wrapper.snapshot()[1] == 0.0
+        wrapper.bus.registers[_REG_CURRENT] = 100
+        deadline = time.monotonic() + 1.0
+        while wrapper.snapshot()[1] != pytest.approx(10.0):
+            assert time.monotonic() < deadline, "snapshot not refreshed by the polling thread"
+            time.sleep(0.005)
+    finally:
+        wrapper.close_communication()
+    assert wrapper._poll_thread is None and wrapper._poll_timer is None
+
+
+def test_instance_shared_per_bus_and_address():
+    first = INA219Wrapper.instance(1, ADDR)
+    second = INA219Wrapper.instance(1, ADDR)
+    other = INA219Wrapper.instance(1, ADDR + 1)
+    try:
+        assert first is second
+        assert other is not first
+        assert len(FakeSMBus.opened) == 2
+    finally:
+        for wrapper in (first, second, other):
+            wrapper.close_communication()
+
+
+def test_auto_detected_address_shares_the_entry(monkeypatch):
+    monkeypatch.setattr(INA219_wrapper, 'find_ina219_address', lambda i2c_bus: ADDR)
+    detected = INA219Wrapper.instance(1)
+    explicit = INA219Wrapper.instance(1, ADDR)
+    try:
+        assert detected is explicit
+        assert len(FakeSMBus.opened) == 1
+    finally:
+        detected.close_communication()
+        explicit.close_communication()
+
+
+def test_bus_closed_by_last_user_only():
+    first = INA219Wrapper.instance(1, ADDR)
+    second = INA219Wrapper.instance(1, ADDR)
+    bus = first.bus
+
+    first.close_communication()
+    assert not bus.closed
+    assert first._poll_thread is not None
+
+    second.close_communication()
+    assert bus.closed
+    assert first._poll_thread is None
+    assert INA219Wrapper._instances == {}
+
+    # A new user gets a fresh wrapper on a reopened bus
+    third = INA219Wrapper.instance(1, ADDR)
+    assert third is not first
+    assert not third.bus.closed
+    third.close_communication()
+
+
+def test_instance_failure_releases_bus():
+    FakeSMBus.fail_reads = True
+    with pytest.raises(OSError):
+        INA219Wrapper.instance(1, ADDR)
+    assert FakeSMBus.opened[0].closed
+    assert INA219Wrapper._instances == {}
+
+
+def test_no_device_releases_bus(monkeypatch):
+    monkeypatch.setattr(INA219_wrapper, 'find_ina219_address', lambda i2c_bus: None)
+    with pytest.raises(RuntimeError):
+        INA219Wrapper.instance(1)
+    assert FakeSMBus.opened[0].closed
+    assert INA219Wrapper._instances == {}
+
+
+def test_signed_registers():
+    wrapper = INA219Wrapper(1, ADDR)
+    wrapper.bus.registers.update({_REG_BUSVOLTAGE: 3000 << 3, _REG_CURRENT: 0xFFFF, _REG_POWER: 0x8000,
+                                  _REG_SHUNTVOLTAGE: 0x8000})
+    bus_v, current, power = wrapper.read_all()
+    assert bus_v == pytest.approx(12.0)
+    assert current == pytest.approx(-0.1)  # -1 LSB
+    assert power == pytest.approx(65.536)  # POWER is unsigned
+    assert wrapper.get_current_mA() == pytest.approx(-0.1)
+    assert wrapper.getPower_W() == pytest.approx(65.536)
+    assert wrapper.getShuntVoltage_mV() == pytest.approx(-327.68)
+    wrapper.close_communication()
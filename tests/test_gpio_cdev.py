@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the GPIO character device structures and ioctl numbers (no GPIO chip needed).
+"""
+import pytest
+
+pytest.importorskip("pymodaq")  # Imported by the package __init__
+
+from pymodaq_plugins_raspberrypi.hardware import gpio_cdev
+
+
+def test_struct_sizes():
+    # sizeof() of the linux/gpio.h v2 structures
+    assert gpio_cdev._LINE_REQUEST.size == 592
+    assert gpio_cdev._LINE_VALUES.size == 16
+    assert gpio_cdev._LINE_EVENT.size == 48
+
+
+def test_ioctl_numbers():
+    assert gpio_cdev.GPIO_V2_GET_LINE_IOCTL == 0xC250B407
+    assert gpio_cdev.GPIO_V2_LINE_GET_VALUES_IOCTL == 0xC010B40E
+    assert gpio_cdev.GPIO_V2_LINE_SET_VALUES_IOCTL == 0xC010B40F
+
+
+def test_pack_values():
+    assert gpio_cdev.pack_values(0b101, 0b111) == (5).to_bytes(8, 'little') + (7).to_bytes(8, 'little')
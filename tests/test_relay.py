@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the relay GPIO wrapper, with a fake lgpio module standing for the GPIO chip.
+"""
+import pytest
+
+pytest.importorskip("pymodaq")
+
+from pymodaq_plugins_raspberrypi.daq_move_plugins import daq_move_Relay
+from pymodaq_plugins_raspberrypi.daq_move_plugins.daq_move_Relay import GPIORelayWrapper, pack_values
+
+
+class FakeLgpio:
+    """Records the lgpio calls made by the relay wrapper, each gpiochip_open returns a new handle."""
+
+    BOTH_EDGES = 3
+
+    def __init__(self):
+        self.calls = []
+        self._handles = 0
+
+    def gpiochip_open(self, chip):
+        self._handles += 1
+        return self._handles
+
+    def __getattr__(self, name):
+        def call(*args):
+            self.calls.append((name, *args))
+            return 0
+        return call
+
+
+@pytest.fixture
+def lgpio(monkeypatch):
+    fake = FakeLgpio()
+    monkeypatch.setattr(daq_move_Relay, '_BACKEND', 'lgpio')
+    monkeypatch.setattr(daq_move_Relay, 'lgpio', fake)
+    monkeypatch.setattr(daq_move_Relay, 'open_gpiomem', lambda: None)
+    return fake
+
+
+def test_set_states_packs_one_bit_per_relay(lgpio):
+    relay = GPIORelayWrapper(26)
+    handle = relay._h
+    relay.set_states({26: 1, 19: 0, 13: 1})
+    # Active low relays: ON is bit 0, OFF bit 1, in group order
+    assert ('group_claim_output', handle, [26, 19, 13], [1, 1, 1]) in lgpio.calls
+    assert lgpio.calls[-1] == ('group_write', handle, 26, 0b010)
+    assert relay.get_state() == 1
+
+    lgpio.calls.clear()
+    relay.set_states({26: 0, 19: 1, 13: 2})  # Same group, not claimed again, out of range is OFF
+    assert lgpio.calls == [('group_write', handle, 26, 0b101)]
+    assert relay.get_state() == 0
+
+
+def test_pin_ownership_is_per_wrapper(lgpio):
+    other = GPIORelayWrapper(5)
+    relay = GPIORelayWrapper(26)
+    relay.set_states({26: 1, 5: 0})
+    # The pin claimed by the other wrapper's handle is not freed from this one, the group is claimed on ours
+    assert ('gpio_free', relay._h, 5) not in lgpio.calls
+    assert ('group_claim_output', relay._h, [26, 5], [1, 1]) in lgpio.calls
+    relay.cleanup()
+    assert relay._owned == set()
+    assert 5 in other._owned
+    other.cleanup()
+
+
+@pytest.mark.parametrize('compatible, mapped', [
+    (b'raspberrypi,4-model-b\0brcm,bcm2711\0', True),
+    (b'raspberrypi,5-model-b\0brcm,bcm2712\0', False),
+])
+def test_gpiomem_only_on_bcm283x_layout(tmp_path, monkeypatch, compatible, mapped):
+    path = tmp_path / 'compatible'
+    path.write_bytes(compatible)
+    monkeypatch.setattr(daq_move_Relay, 'DEVICE_TREE_COMPATIBLE', str(path))
+    monkeypatch.setattr(daq_move_Relay, 'GPIOMemRegisters', lambda: 'mapped')
+    assert (daq_move_Relay.open_gpiomem() == 'mapped') is mapped
+
+
+class FakeLines:
+    """Stand-in for GPIOLines recording the requests and writes."""
+
+    requests = []
+
+    def __init__(self, offsets, flags, chip=0, consumer='', output_values=0):
+        self.offsets = list(offsets)
+        self.output_values = output_values
+        self.writes = []
+        self.closed = False
+        FakeLines.requests.append(self)
+
+    def set_values(self, bits, mask=1):
+        self.writes.append(pack_values(bits, mask))
+
+    def write_values(self, values):
+        self.writes.append(values)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def cdev(monkeypatch):
+    monkeypatch.setattr(daq_move_Relay, '_BACKEND', 'cdev')
+    monkeypatch.setattr(daq_move_Relay, 'GPIOLines', FakeLines)
+    monkeypatch.setattr(daq_move_Relay, 'open_gpiomem', lambda: None)
+    monkeypatch.setattr(FakeLines, 'requests', [])
+    return FakeLines.requests
+
+
+def test_cdev_group_takes_over_the_relay_line(cdev):
+    relay = GPIORelayWrapper(26)
+    single = cdev[0]
+    relay.set_states({19: 0, 26: 1})
+    group = cdev[1]
+    assert single.closed
+    assert group.offsets == [19, 26] and group.output_values == 0b11
+    assert group.writes[-1] == pack_values(0b01, 0b11)  # 19 OFF (HIGH), 26 ON (LOW)
+    relay.set_state(0)  # Written as the relay bit of the group request
+    assert group.writes[-1] == pack_values(0b10, 0b10)
+
+
+def test_new_group_gives_the_relay_pin_back(lgpio):
+    relay = GPIORelayWrapper(26)
+    relay.set_states({26: 1, 19: 1})
+    lgpio.calls.clear()
+    relay.set_states({5: 1})
+    assert lgpio.calls[:2] == [('group_free', relay._h, 26), ('gpio_claim_output', relay._h, 26, 1)]
+    relay.cleanup()
+    assert relay._owned == set()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the servo plugin helpers, with a fake pigpio connection standing for pigpiod.
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("pymodaq")
+
+from pymodaq_plugins_raspberrypi.daq_move_plugins import daq_move_Servo
+from pymodaq_plugins_raspberrypi.daq_move_plugins.daq_move_Servo import (
+    DAQ_Move_Servo, ServoWrapper, VALID_GPIO_MASK, VALID_GPIO_PINS
+)
+
+
+class FakePi:
+    """Records the hardware_PWM calls."""
+
+    def __init__(self):
+        self.pwm = []
+
+    def hardware_PWM(self, pin, frequency, duty):
+        self.pwm.append((pin, frequency, duty))
+
+
+class FakeFactory:
+    def __init__(self):
+        self.connection = FakePi()
+
+
+@pytest.fixture
+def pi(monkeypatch):
+    factory = FakeFactory()
+    monkeypatch.setattr(daq_move_Servo, 'get_factory', lambda: factory)
+    monkeypatch.setattr(daq_move_Servo, '_PWM_CHANNELS_IN_USE', set())
+    return factory.connection
+
+
+def test_small_steps_accumulate(pi):
+    servo = ServoWrapper(18, 90.0)
+    pi.pwm.clear()
+    for _ in range(4):
+        servo.move_to_angle(servo.get_target_angle() + 0.02)
+    # The first two steps stay in the dead band, the third one sends the accumulated 0.06 degree
+    assert len(pi.pwm) == 1
+    assert servo.get_current_angle() == pytest.approx(90.06)
+    assert servo.get_target_angle() == pytest.approx(90.08)
+    servo.close()
+    assert pi.pwm[-1] == (18, 0, 0)
+
+
+def test_extract_value():
+    assert DAQ_Move_Servo.extract_value(12.5) == 12.5
+    assert DAQ_Move_Servo.extract_value(np.float64(45.0)) == 45.0
+    assert DAQ_Move_Servo.extract_value([np.array([30.0])]) == 30.0
+    assert DAQ_Move_Servo.extract_value(90) == 90.0
+
+
+def test_valid_gpio_mask():
+    for pin in range(41):
+        assert bool((VALID_GPIO_MASK >> pin) & 1) == (pin in VALID_GPIO_PINS)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the timerfd periodic timer (Linux only).
+"""
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("pymodaq")  # Imported by the package __init__
+
+from pymodaq_plugins_raspberrypi.hardware.timerfd import PeriodicTimer, _timespec
+
+
+@pytest.mark.parametrize('seconds, expected', [
+    (1.5, (1, 500_000_000)),
+    (0.034, (0, 34_000_000)),
+    (0.9999999999, (1, 0)),  # Rounds up to a whole second, not to tv_nsec == 1e9
+])
+def test_timespec(seconds, expected):
+    spec = _timespec(seconds)
+    assert (spec.tv_sec, spec.tv_nsec) == expected
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="timerfd is Linux only")
+def test_periodic_timer_counts_missed_ticks():
+    timer = PeriodicTimer(0.01)
+    try:
+        assert timer.wait() >= 1
+        time.sleep(0.055)
+        assert timer.wait() >= 4  # Ticks elapsed while not waiting are reported, not lost
+    finally:
+        timer.close()
+    assert timer.fd == -1